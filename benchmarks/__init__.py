@@ -0,0 +1,4 @@
+"""Benchmarks of the evaluation, run as modules from the repository root, e.g.
+
+    python -m benchmarks.bench_edit_ops
+"""
@@ -0,0 +1,108 @@
+"""Benchmark `edit_ops` against the original cell-by-cell implementation.
+
+The misaligned spans are taken from the POS and lemma tags of
+`example_data/el_ud_test.json`, i.e. exactly the calls made by POSMetric and
+LemmaMetric with `skip_unaligned=False`. Synthetic spans of increasing length
+show how both implementations scale.
+
+Run as a module from the repository root:
+
+    python -m benchmarks.bench_edit_ops
+"""
+import json
+import os
+import random
+import timeit
+
+import numpy as np
+
+from segmt_eval.item import Item
+from segmt_eval.utils import align_items, edit_ops
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), '..', 'example_data', 'el_ud_test.json')
+
+
+def edit_ops_legacy(A, B):
+    mA, mB = len(A), len(B)
+    M = np.zeros((mA + 1, mB + 1), np.uint8)
+    M[:, 0] = np.arange(0, mA + 1)
+    M[0, :] = np.arange(0, mB + 1)
+    BP = np.zeros_like(M)
+    BP[:, 0] = 3
+    BP[0, :] = 4
+    for i in range(1, mA + 1):
+        for j in range(1, mB + 1):
+            if A[i - 1] == B[j - 1]:
+                M[i, j] = M[i - 1, j - 1]
+                BP[i, j] = 1
+            else:
+                costs = [M[i - 1, j], M[i, j - 1], M[i - 1, j - 1]]
+                argmin = np.argmin(costs)
+                if argmin == 0:
+                    BP[i, j] = 3
+                elif argmin == 1:
+                    BP[i, j] = 4
+                else:
+                    BP[i, j] = 2
+                M[i, j] = costs[argmin] + 1
+    edits = []
+    i, j = mA, mB
+    while i > 0 or j > 0:
+        move = BP[i, j]
+        if move in [1, 2]:
+            edits.append((A[i - 1], B[j - 1]))
+            i -= 1
+            j -= 1
+        elif move == 3:
+            edits.append((A[i - 1], None))
+            i -= 1
+        else:
+            edits.append((None, B[j - 1]))
+            j -= 1
+    return edits[::-1]
+
+
+def itemize(sent):
+    return [Item(**{'isStopWord': False, 'ner': '', **values}) for values in sent]
+
+
+def misaligned_spans(path):
+    with open(path, encoding='utf8') as f:
+        data = json.load(f)
+    spans = []
+    for sent in data:
+        a = [it for it in itemize(sent['gold']) if it.isMinimumToken]
+        b = [it for it in itemize(sent['pred']) if it.isMinimumToken]
+        for items_a, items_b in align_items(a, b):
+            if len(items_a) == len(items_b) == 1:
+                continue
+            spans.append(([it.pos for it in items_a], [it.pos for it in items_b]))
+            spans.append(([it.lemma for it in items_a], [it.lemma for it in items_b]))
+    return spans
+
+
+def synthetic_spans(length, n, n_labels=17, seed=0):
+    rng = random.Random(seed)
+    labels = [f'TAG{i}' for i in range(n_labels)]
+    spans = []
+    for _ in range(n):
+        A = [rng.choice(labels) for _ in range(length)]
+        B = [x if rng.random() < .8 else rng.choice(labels) for x in A]
+        del B[rng.randrange(len(B))]
+        spans.append((A, B))
+    return spans
+
+
+def bench(name, spans, repeat=3):
+    for A, B in spans:
+        assert edit_ops(A, B) == edit_ops_legacy(A, B)
+    legacy = min(timeit.repeat(lambda: [edit_ops_legacy(A, B) for A, B in spans], number=1, repeat=repeat))
+    current = min(timeit.repeat(lambda: [edit_ops(A, B) for A, B in spans], number=1, repeat=repeat))
+    print(f'{name:<24} {len(spans):>6} spans  legacy {legacy * 1e3:9.1f} ms  '
+          f'current {current * 1e3:9.1f} ms  speedup {legacy / current:6.1f}x')
+
+
+if __name__ == '__main__':
+    bench('el_ud_test.json', misaligned_spans(DATA_FILE))
+    for length in (8, 32, 128, 250):
+        bench(f'synthetic length {length}', synthetic_spans(length, n=max(2, 2000 // length)))
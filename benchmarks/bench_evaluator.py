@@ -0,0 +1,108 @@
+"""Benchmark the throughput and peak memory of the evaluation.
+
+`Evaluator.evaluate` is timed for every task in both modes, along with the
+building blocks it relies on: `align_items`, `edit_ops` on the misaligned
+spans, `convert_items_to_bio` and the NER evaluator. The corpus is
+synthetic (see `synthetic.py`) with the given sentence length, misalignment
+rate, entity density, tag set and vocabulary size, or read from an evaluation
+file. With an unbounded vocabulary (`--vocabulary 0`), the lemma label set
+grows with the corpus as it does on real text, so that run covers the memory
+of the lemma task on open label sets.
+
+Throughput is reported in sentences per second, from the fastest of a few
+repeats. Peak memory is traced with tracemalloc in a separate run, as
+tracing slows down the evaluation.
+
+Run as a module from the repository root:
+
+    python -m benchmarks.bench_evaluator
+    python -m benchmarks.bench_evaluator --sentences 20000 --length 30 --misalignment .2
+    python -m benchmarks.bench_evaluator --vocabulary 0
+    python -m benchmarks.bench_evaluator --data example_data/el_ud_test.json
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from segmt_eval.alignment import AlignedPair
+from segmt_eval.evaluator import Evaluator
+from segmt_eval.metrics.ner_evaluation import Evaluator as NEREvaluator
+from segmt_eval.utils import align_items, convert_items_to_bio, edit_ops, itemize_corpus
+
+from .synthetic import synthetic_corpus
+
+TASKS = {
+    'reference': ['token', 'pos', 'lemma', 'ner'],
+    'agreement': ['token', 'pos', 'lemma'],
+}
+
+
+def measure(fn, repeat):
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def report(name, n_sentences, seconds, peak):
+    print(f'  {name:<28} {n_sentences / seconds:12,.0f} sentences/s  {seconds * 1e3:9.1f} ms  '
+          f'peak {peak / 2 ** 20:8.1f} MiB')
+
+
+def bench_components(gold, pred, repeat):
+    print('components')
+    min_pairs = [(p.min_a, p.min_b) for p in (AlignedPair(a, b) for a, b in zip(gold, pred))]
+    report('align_items', len(gold), *measure(lambda: [align_items(a, b) for a, b in min_pairs], repeat))
+
+    spans = [([it.pos for it in items_a], [it.pos for it in items_b])
+             for a, b in min_pairs for items_a, items_b in align_items(a, b) if len(items_a) != len(items_b)]
+    report(f'edit_ops ({len(spans)} spans)', len(gold),
+           *measure(lambda: [edit_ops(a, b) for a, b in spans], repeat))
+
+    report('convert_items_to_bio', len(gold),
+           *measure(lambda: [(convert_items_to_bio(a), convert_items_to_bio(b)) for a, b in zip(gold, pred)],
+                    repeat))
+
+    labels = [(convert_items_to_bio(a), convert_items_to_bio(b)) for a, b in zip(gold, pred)]
+    labels = [(a, b) for a, b in labels if len(a) == len(b)]
+    tags = sorted({label[2:] for a, b in labels for label in a + b if label != 'O'})
+    report(f'NER evaluator ({len(labels)} sent.)', len(labels),
+           *measure(lambda: NEREvaluator([a for a, _ in labels], [b for _, b in labels], tags).evaluate(), repeat))
+
+
+def bench_evaluator(gold, pred, repeat, workers):
+    for mode, tasks in TASKS.items():
+        print(f'Evaluator, {mode} mode' + (f', {workers} workers' if workers > 1 else ''))
+        for task in tasks + ['all']:
+            evaluator = Evaluator(tasks if task == 'all' else [task], mode=mode, workers=workers,
+                                  skip_unaligned=False)
+            report(task, len(gold), *measure(lambda: evaluator.evaluate(gold, pred), repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data', help='evaluation file to benchmark on instead of a synthetic corpus')
+    parser.add_argument('--sentences', type=int, default=5000)
+    parser.add_argument('--length', type=int, default=12)
+    parser.add_argument('--misalignment', type=float, default=.1)
+    parser.add_argument('--entity-density', type=float, default=.1)
+    parser.add_argument('--tags', type=int, default=17)
+    parser.add_argument('--entity-types', type=int, default=4)
+    parser.add_argument('--vocabulary', type=int, default=2000, help='number of distinct words, 0 for unbounded')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.data:
+        gold, pred = itemize_corpus(args.data)
+        print(f'{args.data}: {len(gold)} sentences')
+    else:
+        gold, pred = synthetic_corpus(args.sentences, args.length, args.misalignment, args.entity_density,
+                                      args.tags, args.entity_types, args.vocabulary)
+        print(f'synthetic: {args.sentences} sentences of {args.length} words on average, misalignment '
+              f'{args.misalignment}, entity density {args.entity_density}, {args.tags} tags, '
+              f'{args.entity_types} entity types, {args.vocabulary or "unbounded"} words')
+    bench_components(gold, pred, args.repeat)
+    bench_evaluator(gold, pred, args.repeat, args.workers)
@@ -0,0 +1,63 @@
+"""Benchmark the overlap check of the NER evaluation.
+
+`find_overlap` used to materialise both ranges as sets and intersect them;
+it now computes the overlap of two ranges from their bounds, and
+`offsets_overlap` answers the same question for two entities without building
+any range. The pairs are taken from entity-dense synthetic sentences, where
+every true entity is checked against every predicted entity, i.e. the scan
+compute_metrics falls back to for unsorted entities.
+
+Run as a module from the repository root:
+
+    python -m benchmarks.bench_find_overlap
+"""
+import random
+import timeit
+
+from segmt_eval.metrics.ner_evaluation import Entity, find_overlap, offsets_overlap
+
+
+def find_overlap_legacy(true_range, pred_range):
+    true_set = set(true_range)
+    pred_set = set(pred_range)
+    return true_set.intersection(pred_set)
+
+
+def synthetic_entities(n_tokens, max_length, seed):
+    rng = random.Random(seed)
+    entities = []
+    start = 0
+    while start < n_tokens:
+        end = min(n_tokens, start + rng.randint(1, max_length))
+        if rng.random() < .8:
+            entities.append(Entity(rng.choice(['PER', 'LOC', 'ORG', 'MISC']), start, end))
+        start = end
+    return entities
+
+
+def entity_pairs(n_sentences, n_tokens, max_length, seed=0):
+    pairs = []
+    for i in range(n_sentences):
+        true = synthetic_entities(n_tokens, max_length, seed=2 * i + seed)
+        pred = synthetic_entities(n_tokens, max_length, seed=2 * i + seed + 1)
+        pairs.extend((t, p) for t in true for p in pred)
+    return pairs
+
+
+def bench(name, pairs, repeat=3):
+    ranges = [(range(t.start_offset, t.end_offset), range(p.start_offset, p.end_offset)) for t, p in pairs]
+    for (t, p), (true_range, pred_range) in zip(pairs, ranges):
+        expected = find_overlap_legacy(true_range, pred_range)
+        assert set(find_overlap(true_range, pred_range)) == expected
+        assert offsets_overlap(t, p) == bool(expected)
+    legacy = min(timeit.repeat(lambda: [find_overlap_legacy(t, p) for t, p in ranges], number=1, repeat=repeat))
+    current = min(timeit.repeat(lambda: [find_overlap(t, p) for t, p in ranges], number=1, repeat=repeat))
+    entities = min(timeit.repeat(lambda: [offsets_overlap(t, p) for t, p in pairs], number=1, repeat=repeat))
+    print(f'{name:<22} {len(pairs):>8} pairs  legacy {legacy * 1e3:8.1f} ms  '
+          f'find_overlap {current * 1e3:8.1f} ms ({legacy / current:5.1f}x)  '
+          f'offsets_overlap {entities * 1e3:8.1f} ms ({legacy / entities:5.1f}x)')
+
+
+if __name__ == '__main__':
+    for max_length in (2, 8, 32):
+        bench(f'entities up to {max_length:>2} tok', entity_pairs(200, 100, max_length))
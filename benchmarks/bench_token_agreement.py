@@ -0,0 +1,128 @@
+"""Benchmark the boundary positions and edit counting of TokenAgreementMetric.
+
+Both are timed against the original implementations, which built a dense
+boundary array mass by mass and walked its substitutions in a Python loop,
+on the minimum tokens of every sentence pair in
+`example_data/el_ud_test.json`, on synthetic sentences of increasing length
+and on document-sized inputs.
+
+Run as a module from the repository root:
+
+    python -m benchmarks.bench_token_agreement
+"""
+import json
+import os
+import random
+import timeit
+
+import numpy as np
+
+from segmt_eval.item import Item
+from segmt_eval.metrics.token import TokenAgreementMetric
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), '..', 'example_data', 'el_ud_test.json')
+
+
+def boundary_array_legacy(items):
+    prev_end = 0
+    masses = []
+    for it in items:
+        start, end = it.startOffSet, it.endOffSet
+        if start > prev_end:
+            masses.append(start - prev_end)
+        masses.append(end - start)
+        prev_end = end
+    arr = np.zeros((sum(masses) - 1,), dtype=bool)
+    pos = 0
+    for mass in masses:
+        curr = pos + mass - 1
+        if curr < sum(masses) - 1:
+            arr[curr] = 1
+        pos += mass
+    return arr
+
+
+def count_edits_legacy(ba1, ba2, winlen=1):
+    subs = ba1 ^ ba2
+    trans = []
+    i = 0
+    while i < subs.shape[0]:
+        if not subs[i]:
+            i += 1
+            continue
+        for offs in range(1, winlen + 1):
+            if i + offs >= subs.shape[0]:
+                break
+            if subs[i + offs] and ((ba1[i] and ba2[i + offs]) or (ba2[i] and ba1[i + offs])):
+                trans.append(1 - offs / (winlen + 1))
+                i += offs + 1
+                break
+        i += 1
+    return dict(n_match=(ba1 & ba2).sum(), n_ad=subs.sum() - len(trans) * 2, n_trans=len(trans),
+                w_trans=sum(trans), n_pot_bounds=len(ba1), n_bounds_A=ba1.sum(), n_bounds_B=ba2.sum())
+
+
+def itemize(sent):
+    return [Item(**{'isStopWord': False, 'ner': '', **values}) for values in sent]
+
+
+def minimum_token_pairs(path):
+    with open(path, encoding='utf8') as f:
+        data = json.load(f)
+    return [([it for it in itemize(sent['gold']) if it.isMinimumToken],
+             [it for it in itemize(sent['pred']) if it.isMinimumToken]) for sent in data]
+
+
+def synthetic_pairs(n_tokens, n, seed=0):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(n):
+        a, b, start = [], [], 0
+        for _ in range(n_tokens):
+            length = rng.randint(1, 8)
+            a.append(Item('x' * length, start, start + length, 'X', 'x', True, False, ''))
+            if length > 1 and rng.random() < .1:
+                b.append(Item('x', start, start + 1, 'X', 'x', True, False, ''))
+                b.append(Item('x' * (length - 1), start + 1, start + length, 'X', 'x', True, False, ''))
+            else:
+                b.append(a[-1])
+            start += length + 1
+        pairs.append((a, b))
+    return pairs
+
+
+def time_min(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def bench(name, pairs, repeat=3):
+    print(name)
+    items = [it for pair in pairs for it in pair]
+    for its in items:
+        positions, n_pos = TokenAgreementMetric._boundary_positions(its)
+        legacy_array = boundary_array_legacy(its)
+        assert positions.tolist() == np.flatnonzero(legacy_array).tolist() and n_pos == len(legacy_array)
+
+    legacy = time_min(lambda: [boundary_array_legacy(its) for its in items], repeat)
+    current = time_min(lambda: [TokenAgreementMetric._boundary_positions(its) for its in items], repeat)
+    print(f'  {"boundaries":<17} {len(items):>6} sentences  legacy {legacy * 1e3:8.1f} ms  '
+          f'current {current * 1e3:8.1f} ms  speedup {legacy / current:5.1f}x')
+
+    arrays = [(boundary_array_legacy(a), boundary_array_legacy(b)) for a, b in pairs]
+    positions = [(np.flatnonzero(ba1), np.flatnonzero(ba2), len(ba1)) for ba1, ba2 in arrays]
+    for winlen in (1, 5, 25):
+        for (ba1, ba2), (pa, pb, n) in zip(arrays, positions):
+            assert dict(TokenAgreementMetric._count_boundary_edits(pa, pb, n, winlen)) == \
+                count_edits_legacy(ba1, ba2, winlen)
+        legacy = time_min(lambda: [count_edits_legacy(ba1, ba2, winlen) for ba1, ba2 in arrays], repeat)
+        current = time_min(lambda: [TokenAgreementMetric._count_boundary_edits(pa, pb, n, winlen)
+                                    for pa, pb, n in positions], repeat)
+        print(f'  {f"edits w={winlen}":<17} {len(arrays):>6} pairs      legacy {legacy * 1e3:8.1f} ms  '
+              f'current {current * 1e3:8.1f} ms  speedup {legacy / current:5.1f}x')
+
+
+if __name__ == '__main__':
+    bench('el_ud_test.json', minimum_token_pairs(DATA_FILE))
+    for n_tokens in (100, 1000):
+        bench(f'synthetic length {n_tokens}', synthetic_pairs(n_tokens, n=max(2, 20000 // n_tokens)))
+    bench('synthetic documents of 5000 tokens', synthetic_pairs(5000, n=2), repeat=1)
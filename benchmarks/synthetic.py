@@ -0,0 +1,168 @@
+"""Synthetic gold and predicted corpora for the benchmarks.
+
+Sentences are made of words separated by spaces, drawn from a vocabulary of
+random words with Zipf-distributed frequencies, or drawn at random each time
+with an unbounded vocabulary. Every word is a minimum token
+with a POS tag and a lemma. Entities span one to three words and are added
+as a separate item that covers those words and is not a minimum token, the
+way multi-word entities appear in the evaluation files.
+
+The predictions copy the gold sentence, and each word is misaligned with
+probability `misalignment`: it is either split into two tokens or merged
+with the next word. POS tags, lemmas and entity types are also replaced with
+that probability, and entities may be dropped or shifted by a word.
+
+Run as a module from the repository root to write a corpus in the format of
+`example_data/el_ud_test.json`:
+
+    python -m benchmarks.synthetic out.json --sentences 1000
+"""
+import argparse
+import itertools
+import json
+import random
+from typing import List, Tuple
+
+from segmt_eval.item import Item
+
+ENTITY_TYPES = ['PER', 'LOC', 'ORG', 'MISC', 'DATE', 'TIME', 'MONEY', 'EVENT']
+
+
+def synthetic_corpus(n_sentences: int, length: int = 12, misalignment: float = .1, entity_density: float = .1,
+                     n_tags: int = 17, n_entity_types: int = 4, vocabulary: int = 2000,
+                     seed: int = 0) -> Tuple[List[List[Item]], List[List[Item]]]:
+    """Generate gold and predicted items
+
+    Parameters
+    ----------
+    n_sentences: number of sentences
+    length: mean number of words of a sentence. Lengths are drawn uniformly between 1 and `2 * length - 1`.
+    misalignment: probability of a word to be segmented differently in the prediction, and of a label to differ
+    entity_density: probability of an entity to start at a word
+    n_tags: number of distinct POS tags
+    n_entity_types: number of distinct entity types, at most `len(ENTITY_TYPES)`
+    vocabulary: number of distinct words, or 0 to draw each word at random. Lemmas are labels of the lemma task, so
+        this bounds its label set size, which otherwise grows with the corpus.
+    seed: seed of the random generator
+
+    Returns
+    -------
+    gold and predicted items of every sentence
+    """
+    rng = random.Random(seed)
+    tags = [f'TAG{i}' for i in range(n_tags)]
+    entity_types = ENTITY_TYPES[:n_entity_types]
+    def random_word():
+        return ''.join(rng.choice('abcdefghij') for _ in range(rng.randint(2, 8)))
+
+    if vocabulary:
+        words_by_rank = list(dict.fromkeys(random_word() for _ in range(vocabulary)))
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words_by_rank) + 1)))
+
+        def random_words(k):
+            return rng.choices(words_by_rank, cum_weights=cum_weights, k=k)
+    else:
+        def random_words(k):
+            return [random_word() for _ in range(k)]
+
+    gold, pred = [], []
+    for _ in range(n_sentences):
+        words = random_words(rng.randint(1, 2 * length - 1))
+        starts = []
+        start = 0
+        for word in words:
+            starts.append(start)
+            start += len(word) + 1
+        word_tags = [rng.choice(tags) for _ in words]
+
+        entities = []
+        i = 0
+        while i < len(words):
+            if rng.random() < entity_density:
+                n = min(rng.randint(1, 3), len(words) - i)
+                entities.append((i, i + n, rng.choice(entity_types)))
+                i += n
+            else:
+                i += 1
+
+        gold.append(_sentence(words, starts, word_tags, entities))
+        pred.append(_predicted_sentence(rng, words, starts, word_tags, entities, tags, entity_types, misalignment))
+    return gold, pred
+
+
+def _sentence(words, starts, word_tags, entities) -> List[Item]:
+    items = [Item(word, start, start + len(word), tag, word, True, False, '')
+             for word, start, tag in zip(words, starts, word_tags)]
+    for first, last, entity_type in entities:
+        start, end = starts[first], starts[last - 1] + len(words[last - 1])
+        text = ' '.join(words[first:last])
+        items.append(Item(text, start, end, word_tags[first], text, False, False, [{'ner': entity_type}]))
+    return items
+
+
+def _predicted_sentence(rng, words, starts, word_tags, entities, tags, entity_types, misalignment) -> List[Item]:
+    def label(gold_label, labels):
+        return rng.choice(labels) if rng.random() < misalignment else gold_label
+
+    items = []
+    i = 0
+    while i < len(words):
+        word, start, tag = words[i], starts[i], label(word_tags[i], tags)
+        if rng.random() < misalignment:
+            if len(word) > 1 and rng.random() < .5:
+                # split the word in two tokens
+                cut = rng.randint(1, len(word) - 1)
+                items.append(Item(word[:cut], start, start + cut, tag, word[:cut], True, False, ''))
+                items.append(Item(word[cut:], start + cut, start + len(word), label(tag, tags), word[cut:], True,
+                                  False, ''))
+                i += 1
+                continue
+            if i + 1 < len(words):
+                # merge the word with the next one
+                text = word + ' ' + words[i + 1]
+                items.append(Item(text, start, start + len(text), tag, text, True, False, ''))
+                i += 2
+                continue
+        items.append(Item(word, start, start + len(word), tag, label(word, [word.upper()]), True, False, ''))
+        i += 1
+
+    for first, last, entity_type in entities:
+        if rng.random() < misalignment:
+            if rng.random() < .5:
+                continue
+            # shift the entity by a word, if it stays within the sentence
+            shift = rng.choice([-1, 1])
+            if 0 <= first + shift and last + shift <= len(words):
+                first, last = first + shift, last + shift
+        start, end = starts[first], starts[last - 1] + len(words[last - 1])
+        text = ' '.join(words[first:last])
+        items.append(Item(text, start, end, word_tags[first], text, False, False,
+                          [{'ner': label(entity_type, entity_types)}]))
+    return items
+
+
+def to_records(gold: List[List[Item]], pred: List[List[Item]]) -> List[dict]:
+    """Records of an evaluation file holding the gold and predicted items"""
+    def as_dicts(items):
+        return [{field: getattr(it, field) for field in Item.__slots__} for it in items]
+
+    return [{'query': ' '.join(it.item for it in a if it.isMinimumToken), 'gold': as_dicts(a), 'pred': as_dicts(b)}
+            for a, b in zip(gold, pred)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic evaluation file')
+    parser.add_argument('path')
+    parser.add_argument('--sentences', type=int, default=1000)
+    parser.add_argument('--length', type=int, default=12)
+    parser.add_argument('--misalignment', type=float, default=.1)
+    parser.add_argument('--entity-density', type=float, default=.1)
+    parser.add_argument('--tags', type=int, default=17)
+    parser.add_argument('--entity-types', type=int, default=4)
+    parser.add_argument('--vocabulary', type=int, default=2000, help='number of distinct words, 0 for unbounded')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    corpus = synthetic_corpus(args.sentences, args.length, args.misalignment, args.entity_density, args.tags,
+                              args.entity_types, args.vocabulary, args.seed)
+    with open(args.path, 'w', encoding='utf8') as f:
+        json.dump(to_records(*corpus), f, ensure_ascii=False)
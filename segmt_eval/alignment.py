@@ -0,0 +1,64 @@
+from collections import Counter
+from typing import List, Tuple
+
+from segmt_eval.item import Item, ItemBatch
+from segmt_eval.utils import align_items, align_items_tolerant
+
+__all__ = ['AlignedPair']
+
+
+class AlignedPair:
+    """A pair of sentences along with the preprocessing shared by the task metrics.
+
+    The minimum tokens of each side and their alignment are computed on first access and
+    cached, so metrics evaluated on the same pair do not repeat that work.
+
+    With `tolerant`, sentences that do not cover the same span or have overlapping items are aligned with
+    `align_items_tolerant` instead of raising, and the irregularities met are counted in `issues`.
+    """
+
+    def __init__(self, a: List[Item], b: List[Item], tolerant: bool = False):
+        self.a = a
+        self.b = b
+        self.tolerant = tolerant
+        self._min_a = None
+        self._min_b = None
+        self._alignment = None
+        self._issues = Counter()
+
+    @property
+    def min_a(self) -> List[Item]:
+        """Items of a that are minimum tokens"""
+        if self._min_a is None:
+            self._min_a = _minimum_tokens(self.a)
+        return self._min_a
+
+    @property
+    def min_b(self) -> List[Item]:
+        """Items of b that are minimum tokens"""
+        if self._min_b is None:
+            self._min_b = _minimum_tokens(self.b)
+        return self._min_b
+
+    @property
+    def alignment(self) -> List[Tuple[List[Item], List[Item]]]:
+        """Alignment of the minimum tokens of a and b, see `align_items`"""
+        if self._alignment is None:
+            if self.tolerant:
+                self._alignment, self._issues = align_items_tolerant(self.min_a, self.min_b)
+            else:
+                self._alignment = align_items(self.min_a, self.min_b)
+        return self._alignment
+
+    @property
+    def issues(self) -> Counter:
+        """Irregularities met when aligning the pair, see `align_items_tolerant`. Always empty unless tolerant"""
+        if self.tolerant:
+            self.alignment  # issues are counted on alignment
+        return self._issues
+
+
+def _minimum_tokens(items: List[Item]) -> List[Item]:
+    if isinstance(items, ItemBatch):
+        return items.minimum_tokens()
+    return [it for it in items if it.isMinimumToken]
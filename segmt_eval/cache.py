@@ -0,0 +1,91 @@
+import hashlib
+import sqlite3
+import zlib
+from typing import Optional
+
+__all__ = ['SegmenterCache']
+
+
+class SegmenterCache:
+    """On-disk cache of segmenter outputs, keyed by segmenter id and query
+
+    Outputs are stored zlib compressed in a sqlite database under the SHA-256 digest of the segmenter id and
+    the query text. When the stored outputs exceed `max_bytes`, the least recently used ones are evicted.
+    The segmenter id should change with every build of the segmenter whose output may differ.
+
+    The cache is meant to be used from a single thread, e.g. the one driving `compose_evaluation_data`.
+    Changes are written to disk on `commit`, `close` or when leaving the `with` block.
+    """
+
+    def __init__(self, path, max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute('CREATE TABLE IF NOT EXISTS outputs '
+                           '(key BLOB PRIMARY KEY, output BLOB NOT NULL, size INTEGER NOT NULL, '
+                           'last_used INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS outputs_last_used ON outputs (last_used)')
+        size, clock = self._conn.execute('SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) '
+                                         'FROM outputs').fetchone()
+        self._size = size
+        # recency is an increasing counter rather than a timestamp, so that ties cannot occur
+        self._clock = clock
+
+    @staticmethod
+    def key(segmenter_id: str, query: str) -> bytes:
+        return hashlib.sha256(f'{segmenter_id}\0{query}'.encode('utf8')).digest()
+
+    def get(self, segmenter_id: str, query: str) -> Optional[str]:
+        """The cached output of the segmenter for the query, None when there is none"""
+        key = SegmenterCache.key(segmenter_id, query)
+        row = self._conn.execute('SELECT output FROM outputs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._clock += 1
+        self._conn.execute('UPDATE outputs SET last_used = ? WHERE key = ?', (self._clock, key))
+        return zlib.decompress(row[0]).decode('utf8')
+
+    def put(self, segmenter_id: str, query: str, output: str):
+        """Cache the output of the segmenter for the query, evicting the least recently used outputs if needed"""
+        key = SegmenterCache.key(segmenter_id, query)
+        data = zlib.compress(output.encode('utf8'))
+        old = self._conn.execute('SELECT size FROM outputs WHERE key = ?', (key,)).fetchone()
+        self._clock += 1
+        self._conn.execute('INSERT OR REPLACE INTO outputs (key, output, size, last_used) VALUES (?, ?, ?, ?)',
+                           (key, data, len(data), self._clock))
+        self._size += len(data) - (old[0] if old is not None else 0)
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute('SELECT key, size FROM outputs ORDER BY last_used LIMIT 256').fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._conn.executemany('DELETE FROM outputs WHERE key = ?', evicted)
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the compressed outputs"""
+        return self._size
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self) -> 'SegmenterCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
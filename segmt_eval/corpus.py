@@ -0,0 +1,152 @@
+import json
+import os
+from array import array
+from collections import abc
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from segmt_eval.item import Item, ItemBatch, StringTable, first_ner_label
+from segmt_eval.utils import iter_json
+
+__all__ = ['ColumnarCorpus', 'ColumnarWriter', 'save_columnar', 'load_columnar', 'convert_to_columnar']
+
+COLUMNS = {
+    'item': np.int32,
+    'startOffSet': np.int32,
+    'endOffSet': np.int32,
+    'pos': np.int32,
+    'lemma': np.int32,
+    'isMinimumToken': np.bool_,
+    'isStopWord': np.bool_,
+    'ner': np.int32,
+}
+STRINGS_FILE = 'strings.json'
+SENTENCES_FILE = 'sentences.npy'
+
+
+class ColumnarCorpus(abc.Sequence):
+    """The sentences of a columnar corpus directory, as ItemBatches
+
+    A corpus directory holds one `.npy` array per column of ItemBatch, with the items of all sentences one
+    after the other, `sentences.npy` with the offset of the first item of each sentence and the total number
+    of items, and `strings.json` with the StringTable shared by all sentences. Columns are memory-mapped
+    when loading, so sentences are read from disk only when they are evaluated.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], sentences: np.ndarray, table: StringTable):
+        self.columns = columns
+        self.sentences = sentences
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.sentences) - 1
+
+    def __getitem__(self, key) -> Union[ItemBatch, List[ItemBatch]]:
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('sentence index out of range')
+        start, end = int(self.sentences[key]), int(self.sentences[key + 1])
+        return ItemBatch(**{name: column[start:end] for name, column in self.columns.items()}, table=self.table)
+
+
+class ColumnarWriter:
+    """Write sentences to a columnar corpus directory, see `ColumnarCorpus`
+
+    The columns are accumulated in memory and saved on `close`, or when leaving the `with` block.
+    """
+
+    def __init__(self, path, table: StringTable = None):
+        self.path = path
+        self.table = table if table is not None else StringTable()
+        self._columns = {name: array('i' if dtype == np.int32 else 'b') for name, dtype in COLUMNS.items()}
+        self._sentences = array('q', [0])
+
+    def add(self, items: Sequence[Item]):
+        intern = self.table.intern
+        columns = self._columns
+        for it in items:
+            columns['item'].append(intern(it.item))
+            columns['startOffSet'].append(it.startOffSet)
+            columns['endOffSet'].append(it.endOffSet)
+            columns['pos'].append(intern(it.pos))
+            columns['lemma'].append(intern(it.lemma))
+            columns['isMinimumToken'].append(bool(it.isMinimumToken))
+            columns['isStopWord'].append(bool(it.isStopWord))
+            columns['ner'].append(intern(first_ner_label(it.ner)))
+        self._sentences.append(len(columns['item']))
+
+    def close(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(self.path, name + '.npy'), np.frombuffer(self._columns[name], dtype=dtype))
+        np.save(os.path.join(self.path, SENTENCES_FILE), np.frombuffer(self._sentences, dtype=np.int64))
+        with open(os.path.join(self.path, STRINGS_FILE), 'w', encoding='utf8') as strings_file:
+            json.dump(self.table.strings, strings_file, ensure_ascii=False)
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def save_columnar(sentences: Iterable[Sequence[Item]], path):
+    """Save the items of each sentence to a columnar corpus directory
+
+    Parameters
+    ----------
+    sentences: iterable of lists of Items or ItemBatches
+    path: directory to write, created when missing
+    """
+    with ColumnarWriter(path) as writer:
+        for items in sentences:
+            writer.add(items)
+
+
+def load_columnar(path, mmap: bool = True) -> ColumnarCorpus:
+    """Load a columnar corpus directory
+
+    Parameters
+    ----------
+    path: directory written by `save_columnar` or `convert_to_columnar`
+    mmap: memory-map the columns instead of reading them into memory
+
+    Returns
+    -------
+    corpus of ItemBatches, one per sentence, sharing a single StringTable
+    """
+    mmap_mode = 'r' if mmap else None
+    columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in COLUMNS}
+    sentences = np.load(os.path.join(path, SENTENCES_FILE), mmap_mode=mmap_mode)
+    with open(os.path.join(path, STRINGS_FILE), 'r', encoding='utf8') as strings_file:
+        table = StringTable(json.load(strings_file))
+    return ColumnarCorpus(columns, sentences, table)
+
+
+def convert_to_columnar(data_path, corpus_path, sides: Tuple[str, ...] = ('gold', 'pred')) -> List[str]:
+    """Convert an evaluation file to a columnar corpus directory per side
+
+    Parameters
+    ----------
+    data_path: JSON array or JSON Lines file of records with "gold" and "pred" item lists
+    corpus_path: directory under which each side is written to its own corpus directory, so a gold set can be
+        converted once and evaluated against many predictions
+    sides: keys of the item lists to convert
+
+    Returns
+    -------
+    paths of the corpus directories of the sides, in order
+    """
+    paths = [os.path.join(corpus_path, side) for side in sides]
+    writers = [ColumnarWriter(path) for path in paths]
+    for sent in iter_json(data_path):
+        for side, writer in zip(sides, writers):
+            writer.add(Item.from_dicts(sent[side]))
+    for writer in writers:
+        writer.close()
+    return paths
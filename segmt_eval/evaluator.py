@@ -1,58 +1,264 @@
-from typing import List, Dict
+import hashlib
+import json
+import os
+from collections import Counter, deque
+from itertools import islice
+from operator import attrgetter
+from multiprocessing import Pool
+from typing import List, Dict, Iterable, Iterator, Tuple
 
 from tqdm import tqdm
 
-from segmt_eval.metrics import TokenMetric, POSMetric, LemmaMetric, NERMetric
+from segmt_eval.alignment import AlignedPair
+from segmt_eval.corpus import load_columnar
+from segmt_eval.metrics import TokenMetric, POSMetric, LemmaMetric, NERMetric, AlignmentMetric
 
 __all__ = ['Evaluator']
 
 from .item import Item
+from .metrics.base import TaskMetric
 
 METRICS = {
     'token': TokenMetric,
     'lemma': LemmaMetric,
     'pos': POSMetric,
-    'ner': NERMetric
+    'ner': NERMetric,
+    'alignment': AlignmentMetric
 }
 
 
 class Evaluator:
-    def __init__(self, tasks: List[str], mode: str = 'reference', verbose: bool = False, **kwargs):
+    def __init__(self, tasks: List[str], mode: str = 'reference', verbose: bool = False, workers: int = 1,
+                 chunk_size: int = 1000, tolerant: bool = False, **kwargs):
         """
 
         Parameters
         ----------
-        tasks: list of tasks to evaluate. Tasks are `token`, `lemma`, `pos`, `ner`
+        tasks: list of tasks to evaluate. Tasks are `token`, `lemma`, `pos`, `ner`, `alignment`
         mode: `reference` or `agreement`. Reference evaluates a predicted set against a ground truth set.
             Agreement evaluates two predicted sets against each other.
         verbose: display progress bar
+        workers: number of processes to evaluate with. With more than one worker, the sentence pairs
+            are sharded into chunks of `chunk_size` pairs, each evaluated by its own set of metrics,
+            and the metric states are merged in order before aggregation.
+        chunk_size: number of sentence pairs per chunk. Chunks are the unit of work of the workers, and metrics
+            that evaluate many pairs at once get a chunk at a time.
+        tolerant: align sentences that do not cover the same span or have overlapping items instead of raising,
+            and skip them in the token agreement. The `alignment` task, which counts such sentences, is then
+            always evaluated.
         kwargs: keyword arguments specific to each task
         """
         self.tasks = tasks
+        if tolerant and 'alignment' not in tasks:
+            self.tasks = list(tasks) + ['alignment']
         self.mode = mode
         self.verbose = verbose
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.tolerant = tolerant
         self.kwargs = kwargs
 
-    def evaluate(self, A: List[List[Item]], B: List[List[Item]]) -> Dict[str, Dict[str, float]]:
+    def evaluate(self, A: Iterable[List[Item]], B: Iterable[List[Item]]) -> Dict[str, Dict[str, float]]:
         """Evaluate B against A.
 
 
         Parameters
         ----------
-        A: List of list of Items. In reference mode, this would be the gold set.
-        B: List of list of Items. In reference mode, this would be the predicted set.
+        A: Iterable of list of Items. In reference mode, this would be the gold set.
+        B: Iterable of list of Items. In reference mode, this would be the predicted set.
+            A and B are consumed one sentence at a time, so they can be generators.
 
         Returns
         -------
         dictionary from tasks to score names to scores.
         """
-        metrics = {
-            task: METRICS[task](self.mode, **self.kwargs)
-            for task in self.tasks
+        return self.evaluate_pairs(zip(A, B))
+
+    def evaluate_columnar(self, A_path, B_path) -> Dict[str, Dict[str, float]]:
+        """Evaluate the columnar corpus at B_path against the one at A_path.
+
+        Parameters
+        ----------
+        A_path, B_path: columnar corpus directories, see `segmt_eval.corpus.convert_to_columnar`. They are
+            memory-mapped, so sentences are read from disk as they are evaluated.
+
+        Returns
+        -------
+        dictionary from tasks to score names to scores.
+        """
+        A, B = load_columnar(A_path), load_columnar(B_path)
+        if len(A) != len(B):
+            raise ValueError(f'corpora have {len(A)} and {len(B)} sentences')
+        return self.evaluate(A, B)
+
+    def evaluate_pairs(self, pairs: Iterable[Tuple[List[Item], List[Item]]]) -> Dict[str, Dict[str, float]]:
+        """Evaluate the second against the first list of Items of each pair.
+
+        Parameters
+        ----------
+        pairs: Iterable of pairs of lists of Items, e.g. `segmt_eval.utils.iter_sentence_pairs`. Pairs are
+            consumed one at a time, so the corpus does not need to fit in memory.
+
+        Returns
+        -------
+        dictionary from tasks to score names to scores.
+        """
+        if self.workers > 1:
+            metrics = self._evaluate_parallel(pairs)
+        else:
+            metrics = _evaluate_chunk(self.tasks, self.mode, self.kwargs,
+                                      tqdm(pairs, disable=not self.verbose), self.chunk_size, self.tolerant)
+        return {
+            task: metric.aggregate() for task, metric in metrics.items()
         }
-        for a, b in tqdm(zip(A, B), disable=not self.verbose):
-            for metric in metrics.values():
-                metric.single(a, b)
+
+    def evaluate_incremental(self, pairs: Iterable[Tuple[List[Item], List[Item]]],
+                             state_path) -> Dict[str, Dict[str, float]]:
+        """Evaluate like `evaluate_pairs`, only scoring the sentence pairs that changed since the previous run.
+
+        The metric counts of every distinct pair (see `TaskMetric.to_counts`) are stored in `state_path` under
+        a digest of the pair, along with the aggregated counts. On the next run with the same settings, pairs
+        with a stored digest are not scored again: the counts of the pairs that are gone are subtracted from the
+        aggregate, and those of the new pairs are added, so the time taken grows with the number of changed
+        pairs. New pairs are scored in chunks of `chunk_size` pairs, by `workers` processes when more than one.
+
+        Parameters
+        ----------
+        pairs: Iterable of pairs of lists of Items, as in `evaluate_pairs`
+        state_path: JSON file holding the state of the previous run. Created when missing, and replaced by the
+            state of this run. The keyword arguments of the tasks must be JSON serializable.
+
+        Returns
+        -------
+        dictionary from tasks to score names to scores.
+        """
+        # as read back from JSON, where tuples become lists
+        settings = json.loads(json.dumps({'tasks': self.tasks, 'mode': self.mode, 'kwargs': self.kwargs,
+                                          'tolerant': self.tolerant}))
+        state = None
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf8') as state_file:
+                state = json.load(state_file)
+        if state is None or state['settings'] != settings:
+            state = {'settings': settings, 'metrics': None, 'pairs': {}}
+        metrics = _create_metrics(self.tasks, self.mode, self.kwargs)
+        if state['metrics'] is not None:
+            for task, counts in state['metrics'].items():
+                metrics[task].add_counts(counts)
+        # the state holds the number of times each distinct pair occurs and its counts per task, by digest
+        old_digests = Counter({digest: n for digest, (n, _) in state['pairs'].items()})
+        pair_counts = {digest: counts for digest, (_, counts) in state['pairs'].items()}
+
+        digests = Counter()
+
+        def new_pairs() -> Iterator[Tuple[str, Tuple[List[Item], List[Item]]]]:
+            for a, b in tqdm(pairs, disable=not self.verbose):
+                digest = _pair_digest(a, b)
+                digests[digest] += 1
+                if digest not in pair_counts and digests[digest] == 1:
+                    yield digest, (a, b)
+
+        pair_counts.update(self._pair_counts(new_pairs()))
+        for digest in digests.keys() | old_digests.keys():
+            n = digests[digest] - old_digests[digest]
+            if n:
+                for task, counts in pair_counts[digest].items():
+                    metrics[task].add_counts(counts, n)
+        state['pairs'] = {digest: (n, pair_counts[digest]) for digest, n in digests.items()}
+        state['metrics'] = {task: metric.to_counts() for task, metric in metrics.items()}
+
+        with open(f'{state_path}.tmp', 'w', encoding='utf8') as state_file:
+            json.dump(state, state_file, ensure_ascii=False)
+        os.replace(f'{state_path}.tmp', state_path)
         return {
             task: metric.aggregate() for task, metric in metrics.items()
         }
+
+    def _pair_counts(self, pairs: Iterable[Tuple[str, Tuple[List[Item], List[Item]]]]) -> Iterator[Tuple[str, Dict]]:
+        # metric counts of each keyed pair on its own, computed a chunk at a time
+        chunks = (zip(*chunk) for chunk in _chunks(pairs, self.chunk_size))
+        if self.workers <= 1:
+            for keys, chunk in chunks:
+                yield from zip(keys, _evaluate_pairs_apart(self.tasks, self.mode, self.kwargs, chunk,
+                                                              self.tolerant))
+            return
+        with Pool(self.workers) as pool:
+            # bound the number of chunks in flight, as in `_evaluate_parallel`
+            pending = deque()
+            for keys, chunk in chunks:
+                pending.append((keys, pool.apply_async(_evaluate_pairs_apart,
+                                                       (self.tasks, self.mode, self.kwargs, chunk,
+                                                        self.tolerant))))
+                if len(pending) >= 2 * self.workers:
+                    keys, result = pending.popleft()
+                    yield from zip(keys, result.get())
+            while pending:
+                keys, result = pending.popleft()
+                yield from zip(keys, result.get())
+
+    def _evaluate_parallel(self, pairs: Iterable[Tuple[List[Item], List[Item]]]) -> Dict[str, TaskMetric]:
+        metrics = _create_metrics(self.tasks, self.mode, self.kwargs)
+        progress = tqdm(disable=not self.verbose)
+        with Pool(self.workers) as pool:
+            # bound the number of chunks in flight, so the input is not consumed faster than it is evaluated
+            pending = deque()
+            for chunk in _chunks(pairs, self.chunk_size):
+                pending.append((len(chunk), pool.apply_async(_evaluate_chunk,
+                                                             (self.tasks, self.mode, self.kwargs, chunk,
+                                                              self.chunk_size, self.tolerant))))
+                if len(pending) >= 2 * self.workers:
+                    _merge_metrics(metrics, *pending.popleft(), progress)
+            while pending:
+                _merge_metrics(metrics, *pending.popleft(), progress)
+        progress.close()
+        return metrics
+
+
+def _create_metrics(tasks: List[str], mode: str, kwargs: Dict) -> Dict[str, TaskMetric]:
+    return {
+        task: METRICS[task](mode, **kwargs)
+        for task in tasks
+    }
+
+
+def _evaluate_chunk(tasks: List[str], mode: str, kwargs: Dict,
+                    pairs: Iterable[Tuple[List[Item], List[Item]]], chunk_size: int,
+                    tolerant: bool = False) -> Dict[str, TaskMetric]:
+    metrics = _create_metrics(tasks, mode, kwargs)
+    for chunk in _chunks(pairs, chunk_size):
+        # filtering and alignment are shared by all metrics of the pair
+        aligned = [AlignedPair(a, b, tolerant) for a, b in chunk]
+        for metric in metrics.values():
+            metric.update_pairs(chunk, aligned)
+    return metrics
+
+
+def _evaluate_pairs_apart(tasks: List[str], mode: str, kwargs: Dict,
+                          pairs: Iterable[Tuple[List[Item], List[Item]]], tolerant: bool = False) -> List[Dict]:
+    # the metric counts of each pair on its own
+    return [{task: metric.to_counts() for task, metric in _evaluate_chunk(tasks, mode, kwargs, [pair], 1,
+                                                                          tolerant).items()}
+            for pair in pairs]
+
+
+_ITEM_FIELDS = attrgetter(*Item.__slots__)
+
+
+def _pair_digest(a: List[Item], b: List[Item]) -> str:
+    fields = ([_ITEM_FIELDS(it) for it in a], [_ITEM_FIELDS(it) for it in b])
+    return hashlib.blake2b(repr(fields).encode('utf8'), digest_size=16).hexdigest()
+
+
+def _merge_metrics(metrics: Dict[str, TaskMetric], n_pairs: int, result, progress: tqdm):
+    for task, partial in result.get().items():
+        metrics[task].merge(partial)
+    progress.update(n_pairs)
+
+
+def _chunks(pairs: Iterable[Tuple[List[Item], List[Item]]],
+            size: int) -> Iterator[List[Tuple[List[Item], List[Item]]]]:
+    pairs = iter(pairs)
+    chunk = list(islice(pairs, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(pairs, size))
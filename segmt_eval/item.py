@@ -1,9 +1,14 @@
+from collections import abc
 from dataclasses import dataclass
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Iterable, Iterator, Sequence
+
+import numpy as np
 
 
 @dataclass
 class Item:
+    __slots__ = ('item', 'startOffSet', 'endOffSet', 'pos', 'lemma', 'isMinimumToken', 'isStopWord', 'ner')
+
     item: str
     startOffSet: int
     endOffSet: int
@@ -12,3 +17,135 @@ class Item:
     isMinimumToken: bool
     isStopWord: bool
     ner: Union[str, List[Dict]]
+
+    @classmethod
+    def from_dicts(cls, values: Iterable[Dict]) -> List['Item']:
+        """Items from their decoded JSON objects, `isStopWord` and `ner` defaulting to False and ''
+
+        Items are built positionally, without the keyword arguments of `Item(**value)`. Unknown keys are ignored.
+        """
+        return [cls(value['item'], value['startOffSet'], value['endOffSet'], value['pos'], value['lemma'],
+                    value['isMinimumToken'], value.get('isStopWord', False), value.get('ner', ''))
+                for value in values]
+
+
+def first_ner_label(ner: Union[str, List[Dict]]) -> str:
+    """Label of the first entity of an `ner` annotation, '' when there is none"""
+    return ner[0]['ner'] if ner else ''
+
+
+class StringTable:
+    """Interns strings as dense integer ids"""
+    __slots__ = ('strings', 'ids')
+
+    def __init__(self, strings: Iterable[str] = ()):
+        self.strings = list(strings)
+        self.ids = {s: i for i, s in enumerate(self.strings)}
+
+    def intern(self, s: str) -> int:
+        try:
+            return self.ids[s]
+        except KeyError:
+            self.ids[s] = len(self.strings)
+            self.strings.append(s)
+            return self.ids[s]
+
+    def __getitem__(self, i: int) -> str:
+        return self.strings[i]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class ItemBatch(abc.Sequence):
+    """Columnar representation of the items of a sentence
+
+    Offsets and flags are stored in numpy arrays named after the fields of Item. The string
+    fields `item`, `pos`, `lemma` and `ner` hold ids into a StringTable, which is usually shared
+    by all batches of a corpus. Of the entity annotation, only the label of the first entity is
+    kept, as the empty string when there is none.
+
+    A batch is a sequence of Items, so it can be passed wherever a list of Items is expected.
+    Metrics that know about batches read the columns directly instead.
+    """
+    __slots__ = ('item', 'startOffSet', 'endOffSet', 'pos', 'lemma', 'isMinimumToken', 'isStopWord', 'ner',
+                 'table')
+
+    def __init__(self, item: np.ndarray, startOffSet: np.ndarray, endOffSet: np.ndarray, pos: np.ndarray,
+                 lemma: np.ndarray, isMinimumToken: np.ndarray, isStopWord: np.ndarray, ner: np.ndarray,
+                 table: StringTable):
+        self.item = item
+        self.startOffSet = startOffSet
+        self.endOffSet = endOffSet
+        self.pos = pos
+        self.lemma = lemma
+        self.isMinimumToken = isMinimumToken
+        self.isStopWord = isStopWord
+        self.ner = ner
+        self.table = table
+
+    @classmethod
+    def from_items(cls, items: Sequence[Item], table: StringTable = None) -> 'ItemBatch':
+        if table is None:
+            table = StringTable()
+        intern = table.intern
+        return cls(
+            item=np.array([intern(it.item) for it in items], dtype=np.int32),
+            startOffSet=np.array([it.startOffSet for it in items], dtype=np.int32),
+            endOffSet=np.array([it.endOffSet for it in items], dtype=np.int32),
+            pos=np.array([intern(it.pos) for it in items], dtype=np.int32),
+            lemma=np.array([intern(it.lemma) for it in items], dtype=np.int32),
+            isMinimumToken=np.array([it.isMinimumToken for it in items], dtype=bool),
+            isStopWord=np.array([it.isStopWord for it in items], dtype=bool),
+            ner=np.array([intern(first_ner_label(it.ner)) for it in items], dtype=np.int32),
+            table=table
+        )
+
+    @classmethod
+    def from_dicts(cls, values: Sequence[Dict], table: StringTable = None) -> 'ItemBatch':
+        """Batch of the decoded JSON objects of items, without building the Items, see `Item.from_dicts`"""
+        if table is None:
+            table = StringTable()
+        intern = table.intern
+        return cls(
+            item=np.array([intern(value['item']) for value in values], dtype=np.int32),
+            startOffSet=np.array([value['startOffSet'] for value in values], dtype=np.int32),
+            endOffSet=np.array([value['endOffSet'] for value in values], dtype=np.int32),
+            pos=np.array([intern(value['pos']) for value in values], dtype=np.int32),
+            lemma=np.array([intern(value['lemma']) for value in values], dtype=np.int32),
+            isMinimumToken=np.array([value['isMinimumToken'] for value in values], dtype=bool),
+            isStopWord=np.array([value.get('isStopWord', False) for value in values], dtype=bool),
+            ner=np.array([intern(first_ner_label(value.get('ner'))) for value in values], dtype=np.int32),
+            table=table
+        )
+
+    def to_items(self) -> List[Item]:
+        strings = self.table.strings
+        return [
+            Item(strings[item], start, end, strings[pos], strings[lemma], is_min, is_stop,
+                 [{'ner': strings[ner]}] if strings[ner] else '')
+            for item, start, end, pos, lemma, is_min, is_stop, ner in zip(
+                self.item.tolist(), self.startOffSet.tolist(), self.endOffSet.tolist(), self.pos.tolist(),
+                self.lemma.tolist(), self.isMinimumToken.tolist(), self.isStopWord.tolist(), self.ner.tolist())
+        ]
+
+    def minimum_tokens(self) -> 'ItemBatch':
+        """The batch of items that are minimum tokens"""
+        return self[self.isMinimumToken]
+
+    def __len__(self) -> int:
+        return len(self.startOffSet)
+
+    def __getitem__(self, key) -> Union[Item, 'ItemBatch']:
+        if isinstance(key, (int, np.integer)):
+            strings = self.table.strings
+            ner = strings[self.ner[key]]
+            return Item(strings[self.item[key]], int(self.startOffSet[key]), int(self.endOffSet[key]),
+                        strings[self.pos[key]], strings[self.lemma[key]], bool(self.isMinimumToken[key]),
+                        bool(self.isStopWord[key]), [{'ner': ner}] if ner else '')
+        return ItemBatch(self.item[key], self.startOffSet[key], self.endOffSet[key], self.pos[key],
+                         self.lemma[key], self.isMinimumToken[key], self.isStopWord[key], self.ner[key],
+                         self.table)
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self.to_items())
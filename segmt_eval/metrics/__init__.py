@@ -2,5 +2,6 @@ from .token import TokenMetric
 from .pos import POSMetric
 from .lemma import LemmaMetric
 from .ner import NERMetric
+from .alignment import AlignmentMetric
 
-__all__ = [TokenMetric, POSMetric, LemmaMetric, NERMetric]
+__all__ = [TokenMetric, POSMetric, LemmaMetric, NERMetric, AlignmentMetric]
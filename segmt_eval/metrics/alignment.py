@@ -0,0 +1,60 @@
+from collections import Counter
+from typing import List, Dict, Optional
+
+from segmt_eval.alignment import AlignedPair
+from segmt_eval.item import Item
+
+from .base import TaskMetric
+
+__all__ = ['AlignmentMetric']
+
+ALIGNMENT_ISSUES = ['span_mismatch', 'uncovered', 'overlapping']
+
+
+class AlignmentMetric(TaskMetric):
+    """Count the sentence pairs that cannot be aligned as is, see `segmt_eval.utils.align_items_tolerant`.
+
+    Reported as `sentences`, `irregular_sentences` and the number of sentences with each kind of issue, so
+    malformed output shows in the results of a tolerant evaluation rather than aborting it.
+    """
+
+    def __init__(self, mode: str = 'reference', **kwargs):
+        self.mode = mode
+        self._sentences = 0
+        self._irregular = 0
+        self._issues = Counter()
+
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        if pair is None or not pair.tolerant:
+            pair = AlignedPair(a, b, tolerant=True)
+        issues = pair.issues
+        self._sentences += 1
+        self._irregular += bool(issues)
+        self._issues.update(issues.keys())
+        return dict(issues)
+
+    def aggregate(self) -> Dict[str, float]:
+        return {
+            'sentences': self._sentences,
+            'irregular_sentences': self._irregular,
+            **{issue: self._issues[issue] for issue in ALIGNMENT_ISSUES}
+        }
+
+    def merge(self, other: 'AlignmentMetric') -> 'AlignmentMetric':
+        self._sentences += other._sentences
+        self._irregular += other._irregular
+        self._issues.update(other._issues)
+        return self
+
+    def to_counts(self) -> Dict:
+        return {'sentences': self._sentences, 'irregular': self._irregular, 'issues': dict(self._issues)}
+
+    def add_counts(self, counts: Dict, times: int = 1) -> 'AlignmentMetric':
+        self._sentences += times * counts['sentences']
+        self._irregular += times * counts['irregular']
+        issues = Counter({issue: abs(times) * count for issue, count in counts['issues'].items()})
+        if times > 0:
+            self._issues.update(issues)
+        else:
+            self._issues -= issues
+        return self
@@ -1,10 +1,54 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple
+from segmt_eval.alignment import AlignedPair
 from segmt_eval.item import Item
 
 
 class TaskMetric:
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        """Score a single pair of sentences and add it to the aggregate.
+
+        Parameters
+        ----------
+        a, b: items of the two sentences
+        pair: precomputed alignment of a and b, shared between metrics. Computed when not given.
+        """
         raise NotImplementedError
 
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        """Add a single pair of sentences to the aggregate without scoring it.
+
+        Used for bulk evaluation, where only the aggregate is reported. Takes the same arguments as `single`.
+        """
+        self.single(a, b, pair)
+
+    def update_pairs(self, pairs: Sequence[Tuple[List[Item], List[Item]]], aligned: Sequence[AlignedPair]):
+        """Add a chunk of sentence pairs to the aggregate without scoring them.
+
+        `aligned` holds the AlignedPair of each pair. Metrics that can evaluate many pairs at once override this
+        to work on the whole chunk.
+        """
+        for (a, b), pair in zip(pairs, aligned):
+            self.update(a, b, pair)
+
     def aggregate(self) -> Dict[str, float]:
         raise NotImplementedError
+
+    def merge(self, other: 'TaskMetric') -> 'TaskMetric':
+        """Add the state accumulated by another metric of the same type and settings to this one.
+
+        Merging the metrics of consecutive shards of a corpus in order gives the same aggregate
+        as evaluating the whole corpus with a single metric.
+        """
+        raise NotImplementedError
+
+    def to_counts(self):
+        """The state the aggregate is computed from, as plain numbers, strings, lists and dicts.
+
+        Counts can be stored as JSON and added back with `add_counts`. Per-sentence state that is not needed
+        for the aggregate, like the labels kept by the `ner` task, is left out.
+        """
+        raise NotImplementedError
+
+    def add_counts(self, counts, times: int = 1) -> 'TaskMetric':
+        """Add the counts of a metric of the same type and settings `times` times, or remove them when negative"""
+        raise NotImplementedError
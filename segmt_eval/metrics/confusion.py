@@ -0,0 +1,215 @@
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+from segmt_eval.item import StringTable
+
+__all__ = ['ConfusionMatrix', 'label_accuracy', 'label_precision_recall_fscore', 'label_kappa']
+
+
+class ConfusionMatrix:
+    """Running confusion matrix between two sequences of labels.
+
+    Labels are interned as dense ids. `pairs` counts how often label i in the first sequence was paired
+    with label j in the second, for the pairs that occur, along with the diagonal and the row and column
+    marginals. All scores are computed from the marginals, so memory grows with the number of distinct
+    labels and label pairs, not with its square, which matters for open label sets like lemmas.
+    Scores are computed the way scikit-learn computes them from the full label sequences.
+    """
+
+    def __init__(self):
+        self.labels = StringTable()
+        self.pairs = Counter()
+        self._diag = np.zeros(0, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._cols = np.zeros(0, dtype=np.int64)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Dense counts between all labels, only meant for small label sets"""
+        n = len(self.labels)
+        counts = np.zeros((n, n), dtype=np.int64)
+        if self.pairs:
+            (rows, cols), values = zip(*self.pairs.keys()), list(self.pairs.values())
+            counts[rows, cols] = values
+        return counts
+
+    def add(self, a_labels: List[str], b_labels: List[str]):
+        """Count the pairs of labels at the same positions of a_labels and b_labels"""
+        if not a_labels:
+            return
+        intern = self.labels.intern
+        a_ids = [intern(label) for label in a_labels]
+        b_ids = [intern(label) for label in b_labels]
+        self._update(Counter(zip(a_ids, b_ids)), 1)
+
+    def merge(self, other: 'ConfusionMatrix') -> 'ConfusionMatrix':
+        """Add the counts of another matrix, whose labels may be interned in a different order"""
+        self._update(self._remap(other), 1)
+        return self
+
+    def to_counts(self) -> List[Tuple[str, str, int]]:
+        """The count of each label pair that occurs, with the labels as strings"""
+        strings = self.labels.strings
+        return [(strings[i], strings[j], count) for (i, j), count in self.pairs.items()]
+
+    def add_counts(self, counts: List[Tuple[str, str, int]], times: int = 1) -> 'ConfusionMatrix':
+        """Add the label pair counts of `to_counts` `times` times, or remove them when negative"""
+        intern = self.labels.intern
+        pairs = Counter()
+        for a, b, count in counts:
+            pairs[intern(a), intern(b)] += abs(times) * count
+        self._update(pairs, 1 if times > 0 else -1)
+        return self
+
+    def _remap(self, other: 'ConfusionMatrix') -> Counter:
+        ids = [self.labels.intern(label) for label in other.labels.strings]
+        return Counter({(ids[i], ids[j]): count for (i, j), count in other.pairs.items()})
+
+    def _update(self, pairs: Counter, sign: int):
+        if sign > 0:
+            self.pairs.update(pairs)
+        else:
+            self.pairs.subtract(pairs)
+            for pair in [pair for pair in pairs if not self.pairs[pair]]:
+                del self.pairs[pair]
+        self._reserve(len(self.labels))
+        for (i, j), count in pairs.items():
+            self._rows[i] += sign * count
+            self._cols[j] += sign * count
+            if i == j:
+                self._diag[i] += sign * count
+
+    def _reserve(self, n: int):
+        capacity = len(self._diag)
+        if n > capacity:
+            size = max(n, 2 * capacity)
+            self._diag, self._rows, self._cols = (np.concatenate((x, np.zeros(size - capacity, dtype=np.int64)))
+                                                  for x in (self._diag, self._rows, self._cols))
+
+    def __getstate__(self):
+        keys = np.array(list(self.pairs.keys()), dtype=np.int32).reshape(-1, 2)
+        return {'labels': self.labels.strings, 'rows': keys[:, 0], 'cols': keys[:, 1],
+                'values': np.array(list(self.pairs.values()), dtype=np.int64)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.labels = StringTable(state['labels'])
+        self._update(Counter(dict(zip(zip(state['rows'].tolist(), state['cols'].tolist()),
+                                      state['values'].tolist()))), 1)
+
+    def _sorted_marginals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # ids of the labels that occur in either sequence in sorted order, and their diagonal counts, row
+        # sums (first sequence) and column sums (second sequence)
+        n = len(self.labels)
+        diag, rows, cols = self._diag[:n], self._rows[:n], self._cols[:n]
+        present = np.flatnonzero(rows + cols)
+        if not len(present):
+            raise ValueError('cannot score an empty confusion matrix')
+        order = np.array(sorted(present.tolist(), key=self.labels.strings.__getitem__))
+        return order, diag[order], rows[order], cols[order]
+
+    def sorted_counts(self) -> Tuple[List[str], np.ndarray]:
+        """Labels that occur in either sequence in sorted order, and the dense counts between them"""
+        order, _, _, _ = self._sorted_marginals()
+        return [self.labels[i] for i in order], self.counts[np.ix_(order, order)]
+
+    def accuracy(self) -> float:
+        _, diag, rows, _ = self._sorted_marginals()
+        return int(diag.sum()) / int(rows.sum())
+
+    def precision_recall_fscore(self, average: str = 'micro') -> Tuple[float, float, float]:
+        """Precision, recall and F1 taking the first sequence as the truth, as computed by
+        `sklearn.metrics.precision_recall_fscore_support(..., zero_division=0)`
+
+        Parameters
+        ----------
+        average: `micro`, `macro` or `weighted`
+        """
+        _, tp_sum, true_sum, pred_sum = self._sorted_marginals()
+        if average == 'micro':
+            tp_sum, pred_sum, true_sum = tp_sum.sum(keepdims=True), pred_sum.sum(keepdims=True), \
+                true_sum.sum(keepdims=True)
+        elif average not in ('macro', 'weighted'):
+            raise ValueError(f'unsupported average `{average}`')
+
+        precision = _divide(tp_sum, pred_sum)
+        recall = _divide(tp_sum, true_sum)
+        f_score = _divide(2. * tp_sum, 1. * true_sum + pred_sum)
+
+        weights = true_sum if average == 'weighted' and true_sum.sum() > 0 else None
+        return tuple(float(np.average(score, weights=weights)) for score in (precision, recall, f_score))
+
+    def kappa(self) -> float:
+        """Cohen's kappa between the two sequences, as `sklearn.metrics.cohen_kappa_score`
+
+        The expected disagreement N - sum_k row_k * col_k / N only needs the marginals. It is computed
+        in exact integer arithmetic, so it may differ from scikit-learn in the last bits.
+        """
+        _, diag, rows, cols = self._sorted_marginals()
+        n = int(rows.sum())
+        disagreement = n - int(diag.sum())
+        # both scaled by n
+        expected_disagreement = n * n - sum(int(row) * int(col) for row, col in zip(rows, cols))
+        if expected_disagreement == 0:
+            return float('nan')
+        return 1 - disagreement * n / expected_disagreement
+
+
+def label_accuracy(a_labels: List[str], b_labels: List[str]) -> float:
+    """Fraction of positions where a_labels and b_labels agree"""
+    if not a_labels:
+        raise ValueError('cannot score empty label sequences')
+    return sum(1 for a, b in zip(a_labels, b_labels) if a == b) / len(a_labels)
+
+
+def label_precision_recall_fscore(a_labels: List[str], b_labels: List[str],
+                                  average: str = 'micro') -> Tuple[float, float, float]:
+    """Same as `ConfusionMatrix.precision_recall_fscore`, computed in plain python from the label sequences.
+
+    Meant for the few labels of a single sentence, where numpy and scikit-learn overhead dominates.
+    """
+    if average == 'micro':
+        accuracy = label_accuracy(a_labels, b_labels)
+        return accuracy, accuracy, accuracy
+    elif average not in ('macro', 'weighted'):
+        raise ValueError(f'unsupported average `{average}`')
+    if not a_labels:
+        raise ValueError('cannot score empty label sequences')
+    tp_sum = Counter(a for a, b in zip(a_labels, b_labels) if a == b)
+    true_sum = Counter(a_labels)
+    pred_sum = Counter(b_labels)
+    labels = true_sum.keys() | pred_sum.keys()
+    precision = {label: tp_sum[label] / pred_sum[label] if pred_sum[label] else 0. for label in labels}
+    recall = {label: tp_sum[label] / true_sum[label] if true_sum[label] else 0. for label in labels}
+    f_score = {label: 2 * tp_sum[label] / (true_sum[label] + pred_sum[label]) for label in labels}
+    if average == 'macro':
+        return tuple(sum(score.values()) / len(labels) for score in (precision, recall, f_score))
+    n = len(a_labels)
+    return tuple(sum(score[label] * true_sum[label] for label in labels) / n
+                 for score in (precision, recall, f_score))
+
+
+def label_kappa(a_labels: List[str], b_labels: List[str]) -> float:
+    """Same as `ConfusionMatrix.kappa`, computed in plain python from the label sequences"""
+    if not a_labels:
+        raise ValueError('cannot score empty label sequences')
+    n = len(a_labels)
+    disagreement = sum(1 for a, b in zip(a_labels, b_labels) if a != b)
+    true_sum = Counter(a_labels)
+    pred_sum = Counter(b_labels)
+    expected_disagreement = n - sum(count * pred_sum[label] for label, count in true_sum.items()) / n
+    if expected_disagreement == 0:
+        return float('nan')
+    return 1 - disagreement / expected_disagreement
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Element-wise division that gives 0 where the denominator is 0"""
+    mask = denominator == 0
+    denominator = denominator.astype(np.float64)
+    denominator[mask] = 1
+    result = numerator / denominator
+    result[mask] = 0.
+    return result
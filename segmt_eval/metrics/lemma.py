@@ -1,29 +1,33 @@
-from typing import List, Dict
-
-import sklearn.metrics
+from typing import List, Dict, Optional, Tuple
 
+from segmt_eval.alignment import AlignedPair
 from segmt_eval.item import Item
-from segmt_eval.utils import align_items, edit_ops
+from segmt_eval.utils import edit_ops
 
 from .base import TaskMetric
+from .confusion import ConfusionMatrix, label_accuracy, label_kappa
 
 __all__ = ['LemmaMetric']
 
 
 class LemmaMetric(TaskMetric):
-    def __init__(self, mode: str, skip_unaligned: bool = True, **kwargs):
+    def __init__(self, mode: str, skip_unaligned: bool = True, linear_memory: bool = False, **kwargs):
         self.mode = mode
         self.skip_unaligned = skip_unaligned
+        self.linear_memory = linear_memory
+
+        self._confusion = ConfusionMatrix()
+
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        a_lemmas, b_lemmas = self._add(pair if pair is not None else AlignedPair(a, b))
+        return self._score(a_lemmas, b_lemmas)
 
-        self._a_lemmas = []
-        self._b_lemmas = []
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        self._add(pair if pair is not None else AlignedPair(a, b))
 
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
-        a = [it for it in a if it.isMinimumToken]
-        b = [it for it in b if it.isMinimumToken]
-        alignment = align_items(a, b)
+    def _add(self, pair: AlignedPair) -> Tuple[List[str], List[str]]:
         a_lemmas, b_lemmas = [], []
-        for items_a, items_b in alignment:
+        for items_a, items_b in pair.alignment:
             if len(items_a) == len(items_b):
                 a_lemmas.append(items_a[0].lemma)
                 b_lemmas.append(items_b[0].lemma)
@@ -31,23 +35,41 @@ class LemmaMetric(TaskMetric):
                 if self.skip_unaligned:
                     continue
                 edits = edit_ops([it.lemma for it in items_a],
-                                 [it.lemma for it in items_b])
+                                 [it.lemma for it in items_b],
+                                 linear_memory=self.linear_memory)
                 for lemma_a, lemma_b in edits:
                     a_lemmas.append('MISALIGNED' if lemma_a is None else lemma_a)
                     b_lemmas.append('MISALIGNED' if lemma_b is None else lemma_b)
-        self._a_lemmas.extend(a_lemmas)
-        self._b_lemmas.extend(b_lemmas)
-        return self._score(a_lemmas, b_lemmas)
+        self._confusion.add(a_lemmas, b_lemmas)
+        return a_lemmas, b_lemmas
 
     def aggregate(self) -> Dict[str, float]:
-        return self._score(self._a_lemmas, self._b_lemmas)
+        if self.mode == 'reference':
+            return {
+                'accuracy': self._confusion.accuracy()
+            }
+        elif self.mode == 'agreement':
+            return {
+                'kappa': self._confusion.kappa()
+            }
+
+    def merge(self, other: 'LemmaMetric') -> 'LemmaMetric':
+        self._confusion.merge(other._confusion)
+        return self
+
+    def to_counts(self) -> List[Tuple[str, str, int]]:
+        return self._confusion.to_counts()
+
+    def add_counts(self, counts: List[Tuple[str, str, int]], times: int = 1) -> 'LemmaMetric':
+        self._confusion.add_counts(counts, times)
+        return self
 
     def _score(self, a_lemmas, b_lemmas):
         if self.mode == 'reference':
             return {
-                'accuracy': sum(1 for a, b in zip(a_lemmas, b_lemmas) if a == b) / len(a_lemmas)
+                'accuracy': label_accuracy(a_lemmas, b_lemmas)
             }
         elif self.mode == 'agreement':
             return {
-                'kappa': sklearn.metrics.cohen_kappa_score(a_lemmas, b_lemmas)
+                'kappa': label_kappa(a_lemmas, b_lemmas)
             }
@@ -1,8 +1,11 @@
-from typing import List, Dict
+from collections import Counter
+from typing import List, Dict, Optional, Set, Tuple
 
+from segmt_eval.alignment import AlignedPair
 from segmt_eval.item import Item
 from segmt_eval.utils import convert_items_to_bio
 from .ner_evaluation.ner_eval import Evaluator as NEREvaluator
+from .ner_evaluation.ner_eval import collect_named_entities, count_scenarios, evaluation_results
 
 from .base import TaskMetric
 
@@ -15,30 +18,53 @@ class NERMetric(TaskMetric):
             raise ValueError(f'only `reference` mode is supported')
         self.skip_unaligned = skip_unaligned
 
-        self._gold_labels = []
-        self._pred_labels = []
+        # the aggregate is computed from the scenario counts, so the BIO labels of the sentences are not kept
         self._label_set = set('O')
+        # number of sentences each label occurs in, so that labels can be dropped when subtracting
+        self._label_counts = Counter()
 
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
+        self._scenarios = Counter()
+        self._spurious = 0
+        self._sentences = 0
+
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        counts = self._add(a, b)
+        if counts is None:
+            return {}
+        sent_scenarios, sent_spurious, sent_labels = counts
+        return NERMetric._add_f1(*evaluation_results(sent_scenarios, sent_spurious, sent_labels))
+
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        self._add(a, b)
+
+    def _add(self, a: List[Item], b: List[Item]) -> Optional[Tuple[Counter, int, Set[str]]]:
         sent_gold_labels = convert_items_to_bio(a)
         sent_pred_labels = convert_items_to_bio(b)
         if len(sent_gold_labels) != len(sent_pred_labels):
             if self.skip_unaligned:
-                return {}
+                return None
             m = min(len(sent_gold_labels), len(sent_pred_labels))
             sent_gold_labels = sent_gold_labels[:m]
             sent_pred_labels = sent_pred_labels[:m]
         sent_labels =  set([label.replace('B-', '').replace('I-', '')
                             for label in sent_gold_labels + sent_pred_labels])
-        self._gold_labels.append(sent_gold_labels)
-        self._pred_labels.append(sent_pred_labels)
+        sent_scenarios, sent_spurious = count_scenarios(collect_named_entities(sent_gold_labels),
+                                                        collect_named_entities(sent_pred_labels),
+                                                        sent_labels)
         self._label_set |= sent_labels
-        return NERMetric.score([sent_gold_labels], [sent_pred_labels], sent_labels)
+        self._label_counts.update(sent_labels)
+        self._scenarios.update(sent_scenarios)
+        self._spurious += sent_spurious
+        self._sentences += 1
+        return sent_scenarios, sent_spurious, sent_labels
 
     @staticmethod
     def score(a: List[str], b: List[str], tags: List[str]) -> Dict[str, float]:
         evaluator = NEREvaluator(a, b, tags)
-        results, results_per_label = evaluator.evaluate()
+        return NERMetric._add_f1(*evaluator.evaluate())
+
+    @staticmethod
+    def _add_f1(results: Dict, results_per_label: Dict) -> Dict[str, Dict]:
         for k in results:
             p = results[k]['precision']
             r = results[k]['recall']
@@ -57,5 +83,40 @@ class NERMetric(TaskMetric):
         }
 
     def aggregate(self) -> Dict[str, float]:
-        return NERMetric.score(self._gold_labels, self._pred_labels, self._label_set)
+        # entities are only filtered by the labels of their own sentence, so the per-sentence counts hold for the
+        # labels of the whole corpus; spurious entities count towards all of them
+        if not self._sentences:
+            return NERMetric.score([], [], self._label_set)
+        return NERMetric._add_f1(*evaluation_results(self._scenarios, self._spurious, self._label_set))
+
+    def merge(self, other: 'NERMetric') -> 'NERMetric':
+        self._label_set |= other._label_set
+        self._label_counts.update(other._label_counts)
+        self._scenarios.update(other._scenarios)
+        self._spurious += other._spurious
+        self._sentences += other._sentences
+        return self
+
+    def to_counts(self) -> Dict:
+        return {
+            'labels': dict(self._label_counts),
+            'scenarios': [(e_type, scenario, count) for (e_type, scenario), count in self._scenarios.items()],
+            'spurious': self._spurious,
+            'sentences': self._sentences,
+        }
+
+    def add_counts(self, counts: Dict, times: int = 1) -> 'NERMetric':
+        label_counts = Counter({label: abs(times) * count for label, count in counts['labels'].items()})
+        scenarios = Counter({(e_type, scenario): abs(times) * count
+                             for e_type, scenario, count in counts['scenarios']})
+        if times > 0:
+            self._label_counts.update(label_counts)
+            self._scenarios.update(scenarios)
+        else:
+            self._label_counts -= label_counts
+            self._scenarios -= scenarios
+        self._label_set = set('O') | set(self._label_counts)
+        self._spurious += times * counts['spurious']
+        self._sentences += times * counts['sentences']
+        return self
 
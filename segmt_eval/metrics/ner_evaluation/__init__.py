@@ -0,0 +1,13 @@
+from .ner_eval import Entity
+from .ner_eval import Evaluator
+from .ner_eval import TrueEntityIndex
+from .ner_eval import collect_named_entities
+from .ner_eval import compute_metrics
+from .ner_eval import count_scenarios
+from .ner_eval import scenario_metrics
+from .ner_eval import evaluation_results
+from .ner_eval import find_overlap
+from .ner_eval import offsets_overlap
+from .ner_eval import compute_actual_possible
+from .ner_eval import compute_precision_recall
+from .ner_eval import compute_precision_recall_wrapper
@@ -1,9 +1,25 @@
-from collections import namedtuple
-from copy import deepcopy
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+
+import numpy as np
 
 
 Entity = namedtuple("Entity", "e_type start_offset end_offset")
 
+# Metrics reported by the Evaluator for every schema.
+
+RESULT_METRICS = {
+    'correct': 0,
+    'incorrect': 0,
+    'partial': 0,
+    'missed': 0,
+    'spurious': 0,
+    'possible': 0,
+    'actual': 0,
+    'precision': 0,
+    'recall': 0,
+}
+
 
 class Evaluator():
 
@@ -20,34 +36,26 @@ class Evaluator():
 
         # Setup dict into which metrics will be stored.
 
-        self.metrics_results = {
-            'correct': 0,
-            'incorrect': 0,
-            'partial': 0,
-            'missed': 0,
-            'spurious': 0,
-            'possible': 0,
-            'actual': 0,
-            'precision': 0,
-            'recall': 0,
-        }
+        self.metrics_results = dict(RESULT_METRICS)
 
-        # Copy results dict to cover the four schemes.
+        # Copy results dict to cover the four schemes, for every tag.
 
-        self.results = {
-            'strict': deepcopy(self.metrics_results),
-            'ent_type': deepcopy(self.metrics_results),
-            'partial':deepcopy(self.metrics_results),
-            'exact':deepcopy(self.metrics_results),
-            }
+        self.results = {eval_schema: dict(self.metrics_results) for eval_schema in EVAL_SCHEMAS}
 
-        # Create an accumulator to store results
-
-        self.evaluation_agg_entities_type = {e: deepcopy(self.results) for e in tags}
+        self.evaluation_agg_entities_type = {
+            e: {eval_schema: dict(self.metrics_results) for eval_schema in EVAL_SCHEMAS} for e in tags
+        }
 
 
     def evaluate(self):
 
+        # Only raw scenario counts are accumulated per document; actual,
+        # possible, precision and recall are derived from the totals.
+
+        scenarios = Counter()
+        spurious = 0
+        documents = 0
+
         for true_ents, pred_ents in zip(self.true, self.pred):
 
             # Check that the length of the true and predicted examples are the
@@ -59,39 +67,20 @@ class Evaluator():
 
             # Compute results for one message
 
-            tmp_results, tmp_agg_results = compute_metrics(
+            doc_scenarios, doc_spurious = count_scenarios(
                 collect_named_entities(true_ents),
                 collect_named_entities(pred_ents),
                 self.tags
             )
 
-            # Cycle through each result and accumulate
-
-            # TODO: Combine these loops below:
-
-            for eval_schema in self.results:
-
-                for metric in self.results[eval_schema]:
-
-                    self.results[eval_schema][metric] += tmp_results[eval_schema][metric]
-
-            # Calculate global precision and recall
-
-            self.results = compute_precision_recall_wrapper(self.results)
+            scenarios.update(doc_scenarios)
+            spurious += doc_spurious
+            documents += 1
 
-            # Aggregate results by entity type
+        if not documents:
+            return self.results, self.evaluation_agg_entities_type
 
-            for e_type in self.tags:
-
-                for eval_schema in tmp_agg_results[e_type]:
-
-                    for metric in tmp_agg_results[e_type][eval_schema]:
-
-                        self.evaluation_agg_entities_type[e_type][eval_schema][metric] += tmp_agg_results[e_type][eval_schema][metric]
-
-                # Calculate precision recall at the individual entity level
-
-                self.evaluation_agg_entities_type[e_type] = compute_precision_recall_wrapper(self.evaluation_agg_entities_type[e_type])
+        self.results, self.evaluation_agg_entities_type = evaluation_results(scenarios, spurious, self.tags)
 
         return self.results, self.evaluation_agg_entities_type
 
@@ -142,27 +131,88 @@ def collect_named_entities(tokens):
     return named_entities
 
 
-def compute_metrics(true_named_entities, pred_named_entities, tags):
+# The metric that each scenario counts towards in every evaluation schema. See
+# http://www.davidsbatista.net/blog/2018/05/09/Named_Entity_Evaluation/
+# for scenario explanation.
+
+SCENARIO_METRICS = {
+    # Scenario I: Exact match between true and pred
+    'exact_match': {'strict': 'correct', 'ent_type': 'correct', 'partial': 'correct', 'exact': 'correct'},
+    # Scenario II: Entities are spurious (i.e., over-generated).
+    'spurious': {'strict': 'spurious', 'ent_type': 'spurious', 'partial': 'spurious', 'exact': 'spurious'},
+    # Scenario III: Entity was missed entirely.
+    'missed': {'strict': 'missed', 'ent_type': 'missed', 'partial': 'missed', 'exact': 'missed'},
+    # Scenario IV: Offsets match, but entity type is wrong
+    'wrong_type': {'strict': 'incorrect', 'ent_type': 'incorrect', 'partial': 'correct', 'exact': 'correct'},
+    # Scenario V: There is an overlap, and the entity type is the same.
+    'overlap_same_type': {'strict': 'incorrect', 'ent_type': 'correct', 'partial': 'partial', 'exact': 'incorrect'},
+    # Scenario VI: Entities overlap, but the entity type is different.
+    'overlap_wrong_type': {'strict': 'incorrect', 'ent_type': 'incorrect', 'partial': 'partial', 'exact': 'incorrect'},
+}
+
+EVAL_SCHEMAS = ['strict', 'ent_type', 'partial', 'exact']
+
+SCENARIOS = list(SCENARIO_METRICS)
+
+COUNTED_METRICS = ['correct', 'incorrect', 'partial', 'missed', 'spurious']
 
+# SCENARIO_COUNTS[scenario, schema, metric] is 1 where the scenario counts
+# towards the metric, so that scenario counts @ SCENARIO_COUNTS gives the
+# metric counts of every schema.
+
+SCENARIO_COUNTS = np.array([
+    [[int(SCENARIO_METRICS[scenario][eval_schema] == metric) for metric in COUNTED_METRICS] for eval_schema in EVAL_SCHEMAS]
+    for scenario in SCENARIOS
+], np.int64)
+
+
+def compute_metrics(true_named_entities, pred_named_entities, tags):
 
     eval_metrics = {'correct': 0, 'incorrect': 0, 'partial': 0, 'missed': 0, 'spurious': 0, 'precision': 0, 'recall': 0}
 
-    # overall results
-    
-    evaluation = {
-        'strict': deepcopy(eval_metrics),
-        'ent_type': deepcopy(eval_metrics),
-        'partial': deepcopy(eval_metrics),
-        'exact': deepcopy(eval_metrics)
-    }
+    scenarios, spurious = count_scenarios(true_named_entities, pred_named_entities, tags)
+
+    evaluation, evaluation_agg_entities_type = scenario_metrics(scenarios, spurious, tags, eval_metrics)
+
+    # Compute 'possible', 'actual' according to SemEval-2013 Task 9.1 on the
+    # overall results, and use these to calculate precision and recall.
+
+    for eval_type in evaluation:
+        evaluation[eval_type] = compute_actual_possible(evaluation[eval_type])
 
-    # results by entity type
+    # Compute 'possible', 'actual', and precision and recall on entity level
+    # results. Start by cycling through the accumulated results.
 
-    evaluation_agg_entities_type = {e: deepcopy(evaluation) for e in tags}
+    for entity_type, entity_level in evaluation_agg_entities_type.items():
+
+        # Cycle through the evaluation types for each dict containing entity
+        # level results.
+
+        for eval_type in entity_level:
+
+            evaluation_agg_entities_type[entity_type][eval_type] = compute_actual_possible(
+                entity_level[eval_type]
+            )
+
+    return evaluation, evaluation_agg_entities_type
+
+
+def count_scenarios(true_named_entities, pred_named_entities, tags):
+    """
+    Counts how often each scenario of SCENARIO_METRICS occurs, by entity type.
+
+    Returns a Counter keyed by (e_type, scenario), which only holds the entity
+    types present in the true or predicted entities, and the number of
+    spurious predictions. Spurious predictions are not attributed to an
+    entity type: they count towards every tag.
+    """
+
+    scenarios = Counter()
+    spurious = 0
 
     # keep track of entities that overlapped
 
-    true_which_overlapped_with_pred = []
+    true_which_overlapped_with_pred = set()
 
     # Subset into only the tags that we are interested in.
     # NOTE: we remove the tags we don't want from both the predicted and the
@@ -172,200 +222,226 @@ def compute_metrics(true_named_entities, pred_named_entities, tags):
     # 2) Where there is a tag in the true data that the model is not capable of
     # predicting.
 
-    true_named_entities = [ent for ent in true_named_entities if ent.e_type in tags]
-    pred_named_entities = [ent for ent in pred_named_entities if ent.e_type in tags]
+    tag_set = set(tags)
+    true_named_entities = [ent for ent in true_named_entities if ent.e_type in tag_set]
+    pred_named_entities = [ent for ent in pred_named_entities if ent.e_type in tag_set]
+
+    # index the true entities, so that each predicted entity is looked up
+    # instead of compared against every true entity
+
+    true_entity_set = set(true_named_entities)
+    true_entity_index = TrueEntityIndex(true_named_entities)
 
     # go through each predicted named-entity
 
     for pred in pred_named_entities:
-        found_overlap = False
-
-        # Check each of the potential scenarios in turn. See
-        # http://www.davidsbatista.net/blog/2018/05/09/Named_Entity_Evaluation/
-        # for scenario explanation.
 
         # Scenario I: Exact match between true and pred
 
-        if pred in true_named_entities:
-            true_which_overlapped_with_pred.append(pred)
-            evaluation['strict']['correct'] += 1
-            evaluation['ent_type']['correct'] += 1
-            evaluation['exact']['correct'] += 1
-            evaluation['partial']['correct'] += 1
+        if pred in true_entity_set:
+            true_which_overlapped_with_pred.add(pred)
+            scenarios[pred.e_type, 'exact_match'] += 1
+            continue
 
-            # for the agg. by e_type results
-            evaluation_agg_entities_type[pred.e_type]['strict']['correct'] += 1
-            evaluation_agg_entities_type[pred.e_type]['ent_type']['correct'] += 1
-            evaluation_agg_entities_type[pred.e_type]['exact']['correct'] += 1
-            evaluation_agg_entities_type[pred.e_type]['partial']['correct'] += 1
+        # find the first true entity with the same offsets or an overlap
 
-        else:
+        true = true_entity_index.first_match(pred)
 
-            # check for overlaps with any of the true entities
+        # Scenario II: Entities are spurious (i.e., over-generated).
 
-            for true in true_named_entities:
+        if true is None:
+            spurious += 1
+            continue
 
-                pred_range = range(pred.start_offset, pred.end_offset)
-                true_range = range(true.start_offset, true.end_offset)
+        true_which_overlapped_with_pred.add(true)
 
-                # Scenario IV: Offsets match, but entity type is wrong
+        # Scenario IV: Offsets match, but entity type is wrong
 
-                if true.start_offset == pred.start_offset and pred.end_offset == true.end_offset \
-                        and true.e_type != pred.e_type:
+        if true.start_offset == pred.start_offset and pred.end_offset == true.end_offset:
+            scenarios[true.e_type, 'wrong_type'] += 1
 
-                    # overall results
-                    evaluation['strict']['incorrect'] += 1
-                    evaluation['ent_type']['incorrect'] += 1
-                    evaluation['partial']['correct'] += 1
-                    evaluation['exact']['correct'] += 1
+        # Scenario V: There is an overlap (but offsets do not match
+        # exactly), and the entity type is the same.
 
-                    # aggregated by entity type results
-                    evaluation_agg_entities_type[true.e_type]['strict']['incorrect'] += 1
-                    evaluation_agg_entities_type[true.e_type]['ent_type']['incorrect'] += 1
-                    evaluation_agg_entities_type[true.e_type]['partial']['correct'] += 1
-                    evaluation_agg_entities_type[true.e_type]['exact']['correct'] += 1
+        elif pred.e_type == true.e_type:
+            scenarios[true.e_type, 'overlap_same_type'] += 1
 
-                    true_which_overlapped_with_pred.append(true)
-                    found_overlap = True
+        # Scenario VI: Entities overlap, but the entity type is
+        # different. Results are counted against the true entity.
 
-                    break
+        else:
+            scenarios[true.e_type, 'overlap_wrong_type'] += 1
 
-                # check for an overlap i.e. not exact boundary match, with true entities
+    # Scenario III: Entity was missed entirely.
 
-                elif find_overlap(true_range, pred_range):
+    for true in true_named_entities:
+        if true not in true_which_overlapped_with_pred:
+            scenarios[true.e_type, 'missed'] += 1
 
-                    true_which_overlapped_with_pred.append(true)
+    return scenarios, spurious
 
-                    # Scenario V: There is an overlap (but offsets do not match
-                    # exactly), and the entity type is the same.
-                    # 2.1 overlaps with the same entity type
 
-                    if pred.e_type == true.e_type:
+def scenario_metrics(scenarios, spurious, tags, metrics):
+    """
+    Turns the output of count_scenarios into the overall and the per entity
+    type result dicts of compute_metrics. The counts are tallied in an array
+    indexed by (tag, schema, metric), and each schema gets a dict with the
+    keys of the metrics template, filled in with the counts.
+
+    NOTE: when pred.e_type is not found in tags or when it simply does not
+    appear in the test set, then it is spurious, but it is not clear where to
+    assign it at the tag level. In this case, it is applied to all target_tags
+    found in this example. This will mean that the sum of the
+    evaluation_agg_entities will not equal evaluation.
+    """
 
-                        # overall results
-                        evaluation['strict']['incorrect'] += 1
-                        evaluation['ent_type']['correct'] += 1
-                        evaluation['partial']['partial'] += 1
-                        evaluation['exact']['incorrect'] += 1
+    tag_index = {e: ix for ix, e in enumerate(tags)}
+    spurious_ix = SCENARIOS.index('spurious')
 
-                        # aggregated by entity type results
-                        evaluation_agg_entities_type[true.e_type]['strict']['incorrect'] += 1
-                        evaluation_agg_entities_type[true.e_type]['ent_type']['correct'] += 1
-                        evaluation_agg_entities_type[true.e_type]['partial']['partial'] += 1
-                        evaluation_agg_entities_type[true.e_type]['exact']['incorrect'] += 1
+    counts = np.zeros((len(tag_index), len(SCENARIOS)), np.int64)
+    for (e_type, scenario), count in scenarios.items():
+        counts[tag_index[e_type], SCENARIOS.index(scenario)] += count
 
-                        found_overlap = True
+    total = counts.sum(axis=0)
+    total[spurious_ix] = spurious
+    counts[:, spurious_ix] = spurious
 
-                        break
+    evaluation = schema_results(total @ SCENARIO_COUNTS.reshape(len(SCENARIOS), -1), metrics)
 
-                    # Scenario VI: Entities overlap, but the entity type is
-                    # different.
+    agg_counts = counts @ SCENARIO_COUNTS.reshape(len(SCENARIOS), -1)
+    evaluation_agg_entities_type = {e: schema_results(agg_counts[tag_index[e]], metrics) for e in tags}
 
-                    else:
-                        # overall results
-                        evaluation['strict']['incorrect'] += 1
-                        evaluation['ent_type']['incorrect'] += 1
-                        evaluation['partial']['partial'] += 1
-                        evaluation['exact']['incorrect'] += 1
+    return evaluation, evaluation_agg_entities_type
 
-                        # aggregated by entity type results
-                        # Results against the true entity
 
-                        evaluation_agg_entities_type[true.e_type]['strict']['incorrect'] += 1
-                        evaluation_agg_entities_type[true.e_type]['partial']['partial'] += 1
-                        evaluation_agg_entities_type[true.e_type]['ent_type']['incorrect'] += 1
-                        evaluation_agg_entities_type[true.e_type]['exact']['incorrect'] += 1
+def evaluation_results(scenarios, spurious, tags):
+    """
+    Computes the results of the Evaluator from count_scenarios totals over
+    all documents: the overall and the per entity type dicts, with actual,
+    possible, precision and recall derived from the counts.
+    """
 
-                        # Results against the predicted entity
+    results, agg_results = scenario_metrics(scenarios, spurious, tags, RESULT_METRICS)
 
-                        # evaluation_agg_entities_type[pred.e_type]['strict']['spurious'] += 1
+    # Calculate global precision and recall
 
-                        found_overlap = True
+    for eval_schema in results:
+        results[eval_schema] = compute_actual_possible(results[eval_schema])
 
-                        break
+    results = compute_precision_recall_wrapper(results)
 
-            # Scenario II: Entities are spurious (i.e., over-generated).
+    # Calculate precision recall at the individual entity level
 
-            if not found_overlap:
+    for e_type in agg_results:
 
-                # Overall results
+        for eval_schema in agg_results[e_type]:
+            agg_results[e_type][eval_schema] = compute_actual_possible(agg_results[e_type][eval_schema])
 
-                evaluation['strict']['spurious'] += 1
-                evaluation['ent_type']['spurious'] += 1
-                evaluation['partial']['spurious'] += 1
-                evaluation['exact']['spurious'] += 1
+        agg_results[e_type] = compute_precision_recall_wrapper(agg_results[e_type])
 
-                # Aggregated by entity type results
+    return results, agg_results
 
-                # NOTE: when pred.e_type is not found in tags
-                # or when it simply does not appear in the test set, then it is
-                # spurious, but it is not clear where to assign it at the tag
-                # level. In this case, it is applied to all target_tags
-                # found in this example. This will mean that the sum of the
-                # evaluation_agg_entities will not equal evaluation.
 
-                for true in tags:                    
+def schema_results(counts, metrics):
+    """
+    Materializes the metric counts of every schema, flattened from
+    (schema, metric) as in SCENARIO_COUNTS, as a dict of schema to a copy of
+    the metrics template.
+    """
 
-                    evaluation_agg_entities_type[true]['strict']['spurious'] += 1
-                    evaluation_agg_entities_type[true]['ent_type']['spurious'] += 1
-                    evaluation_agg_entities_type[true]['partial']['spurious'] += 1
-                    evaluation_agg_entities_type[true]['exact']['spurious'] += 1
+    counts = counts.reshape(len(EVAL_SCHEMAS), len(COUNTED_METRICS)).tolist()
 
-    # Scenario III: Entity was missed entirely.
+    return {
+        eval_schema: {
+            metric: schema_counts[COUNTED_METRICS.index(metric)] if metric in COUNTED_METRICS else value
+            for metric, value in metrics.items()
+        }
+        for eval_schema, schema_counts in zip(EVAL_SCHEMAS, counts)
+    }
 
-    for true in true_named_entities:
-        if true in true_which_overlapped_with_pred:
-            continue
-        else:
-            # overall results
-            evaluation['strict']['missed'] += 1
-            evaluation['ent_type']['missed'] += 1
-            evaluation['partial']['missed'] += 1
-            evaluation['exact']['missed'] += 1
-
-            # for the agg. by e_type
-            evaluation_agg_entities_type[true.e_type]['strict']['missed'] += 1
-            evaluation_agg_entities_type[true.e_type]['ent_type']['missed'] += 1
-            evaluation_agg_entities_type[true.e_type]['partial']['missed'] += 1
-            evaluation_agg_entities_type[true.e_type]['exact']['missed'] += 1
 
-    # Compute 'possible', 'actual' according to SemEval-2013 Task 9.1 on the
-    # overall results, and use these to calculate precision and recall.
+class TrueEntityIndex():
+    """
+    Looks up the true entity that a predicted entity is scored against: the
+    first true entity, in list order, that either has the same offsets or
+    overlaps with it. Overlap is tested as in find_overlap on
+    range(start_offset, end_offset), so entities of a single token never
+    overlap.
+
+    The offsets are hashed, and when the true entities are sorted by start
+    and end offset, as produced by collect_named_entities, overlaps are found
+    by bisecting the offsets. Otherwise every true entity is checked in turn.
+    """
 
-    for eval_type in evaluation:
-        evaluation[eval_type] = compute_actual_possible(evaluation[eval_type])
+    def __init__(self, true_named_entities):
 
-    # Compute 'possible', 'actual', and precision and recall on entity level
-    # results. Start by cycling through the accumulated results.
+        self.entities = true_named_entities
 
-    for entity_type, entity_level in evaluation_agg_entities_type.items():
+        self.first_by_offsets = {}
+        for ix, true in enumerate(true_named_entities):
+            self.first_by_offsets.setdefault((true.start_offset, true.end_offset), ix)
 
-        # Cycle through the evaluation types for each dict containing entity
-        # level results.
+        self.starts = [true.start_offset for true in true_named_entities]
+        self.ends = [true.end_offset for true in true_named_entities]
+        self.is_sorted = all(s1 <= s2 and e1 <= e2 for s1, s2, e1, e2 in
+                             zip(self.starts, self.starts[1:], self.ends, self.ends[1:]))
 
-        for eval_type in entity_level:
+    def first_match(self, pred):
 
-            evaluation_agg_entities_type[entity_type][eval_type] = compute_actual_possible(
-                entity_level[eval_type]
-            )
+        same_offsets = self.first_by_offsets.get((pred.start_offset, pred.end_offset))
+        overlap = self._first_overlap(pred)
 
-    return evaluation, evaluation_agg_entities_type
+        if same_offsets is None and overlap is None:
+            return None
+
+        return self.entities[min(ix for ix in (same_offsets, overlap) if ix is not None)]
+
+    def _first_overlap(self, pred):
+
+        if not self.is_sorted:
+            for ix, true in enumerate(self.entities):
+                if offsets_overlap(true, pred):
+                    return ix
+            return None
+
+        if pred.start_offset >= pred.end_offset:
+            return None
+
+        # true entities ending after pred starts, and starting before pred ends
+
+        lo = bisect_right(self.ends, pred.start_offset)
+        hi = bisect_left(self.starts, pred.end_offset)
+
+        for ix in range(lo, hi):
+            if self.starts[ix] < self.ends[ix]:
+                return ix
+
+        return None
 
 
 def find_overlap(true_range, pred_range):
     """Find the overlap between two ranges
 
     Find the overlap between two ranges. Return the overlapping values if
-    present, else return an empty set().
+    present, else return an empty set(). When both arguments are ranges,
+    the overlap is computed from their bounds and returned as a range,
+    which is empty if they do not overlap.
 
     Examples:
 
     >>> find_overlap((1, 2), (2, 3))
-    2
+    {2}
     >>> find_overlap((1, 2), (3, 4))
     set()
+    >>> find_overlap(range(1, 5), range(3, 8))
+    range(3, 5)
     """
 
+    if isinstance(true_range, range) and isinstance(pred_range, range) \
+            and true_range.step == pred_range.step == 1:
+        return range(max(true_range.start, pred_range.start),
+                     min(true_range.stop, pred_range.stop))
+
     true_set = set(true_range)
     pred_set = set(pred_range)
 
@@ -374,6 +450,18 @@ def find_overlap(true_range, pred_range):
     return overlaps
 
 
+def offsets_overlap(true, pred):
+    """Check whether two entities overlap
+
+    Equivalent to bool(find_overlap(...)) on range(start_offset, end_offset)
+    of both entities, without building the ranges. As with find_overlap, the
+    end offset is exclusive, so an entity with start_offset == end_offset
+    never overlaps.
+    """
+
+    return max(true.start_offset, pred.start_offset) < min(true.end_offset, pred.end_offset)
+
+
 def compute_actual_possible(results):
     """
     Takes a result dict that has been output by compute metrics.
@@ -1,10 +1,13 @@
 from segmt_eval.metrics.ner_evaluation import Entity
 from segmt_eval.metrics.ner_evaluation import compute_metrics
+from segmt_eval.metrics.ner_evaluation import count_scenarios
 from segmt_eval.metrics.ner_evaluation import collect_named_entities
 from segmt_eval.metrics.ner_evaluation import find_overlap
+from segmt_eval.metrics.ner_evaluation import offsets_overlap
 from segmt_eval.metrics.ner_evaluation import compute_actual_possible
 from segmt_eval.metrics.ner_evaluation import compute_precision_recall
 from segmt_eval.metrics.ner_evaluation import compute_precision_recall_wrapper
+from segmt_eval.metrics.ner_evaluation import TrueEntityIndex
 
 
 def test_collect_named_entities_same_type_in_sequence():
@@ -790,6 +793,70 @@ def test_compute_metrics_no_predictions():
     assert results['partial'] == expected['partial']
     assert results['exact'] == expected['exact']
 
+def test_count_scenarios():
+
+    true_named_entities = [
+        Entity('PER', 0, 2),
+        Entity('LOC', 3, 5),
+        Entity('LOC', 6, 9),
+        Entity('ORG', 10, 12),
+        Entity('MISC', 13, 15),
+    ]
+
+    pred_named_entities = [
+        Entity('PER', 0, 2),
+        Entity('ORG', 3, 5),
+        Entity('LOC', 7, 9),
+        Entity('PER', 15, 17),
+        Entity('MISC', 13, 14),
+    ]
+
+    scenarios, spurious = count_scenarios(true_named_entities, pred_named_entities, ['PER', 'LOC', 'ORG'])
+
+    assert scenarios == {
+        ('PER', 'exact_match'): 1,
+        ('LOC', 'wrong_type'): 1,
+        ('LOC', 'overlap_same_type'): 1,
+        ('ORG', 'missed'): 1,
+    }
+    assert spurious == 1
+
+
+def test_true_entity_index_sorted():
+
+    true_named_entities = [
+        Entity('PER', 0, 2),
+        Entity('LOC', 3, 3),
+        Entity('LOC', 4, 7),
+        Entity('ORG', 6, 9),
+    ]
+
+    index = TrueEntityIndex(true_named_entities)
+
+    assert index.is_sorted
+    assert index.first_match(Entity('LOC', 1, 4)) == Entity('PER', 0, 2)
+    assert index.first_match(Entity('PER', 3, 3)) == Entity('LOC', 3, 3)
+    assert index.first_match(Entity('PER', 3, 4)) is None
+    assert index.first_match(Entity('PER', 6, 8)) == Entity('LOC', 4, 7)
+    assert index.first_match(Entity('PER', 8, 12)) == Entity('ORG', 6, 9)
+
+
+def test_true_entity_index_unsorted():
+
+    true_named_entities = [
+        Entity('ORG', 6, 9),
+        Entity('PER', 0, 2),
+        Entity('LOC', 4, 7),
+    ]
+
+    index = TrueEntityIndex(true_named_entities)
+
+    assert not index.is_sorted
+    assert index.first_match(Entity('PER', 5, 8)) == Entity('ORG', 6, 9)
+    assert index.first_match(Entity('PER', 4, 7)) == Entity('ORG', 6, 9)
+    assert index.first_match(Entity('PER', 2, 4)) is None
+
+
 def test_find_overlap_no_overlap():
 
     pred_entity = Entity('LOC', 1, 10)
@@ -854,6 +921,28 @@ def test_find_overlap_end_overlap():
     assert intersect
 
 
+def test_find_overlap_ranges():
+
+    for true_start in range(6):
+        for true_end in range(6):
+            for pred_start in range(6):
+                for pred_end in range(6):
+
+                    true_range = range(true_start, true_end)
+                    pred_range = range(pred_start, pred_end)
+
+                    expected = set(true_range).intersection(set(pred_range))
+
+                    intersect = find_overlap(true_range, pred_range)
+
+                    assert set(intersect) == expected
+
+                    true_entity = Entity('LOC', true_start, true_end)
+                    pred_entity = Entity('LOC', pred_start, pred_end)
+
+                    assert offsets_overlap(true_entity, pred_entity) == bool(expected)
+
+
 def test_compute_actual_possible():
 
     results = {
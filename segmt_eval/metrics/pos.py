@@ -1,30 +1,35 @@
-from typing import List, Dict
-
-import sklearn.metrics
+from typing import List, Dict, Optional, Tuple
 
+from segmt_eval.alignment import AlignedPair
 from segmt_eval.item import Item
-from segmt_eval.utils import align_items, edit_ops
+from segmt_eval.utils import edit_ops
 
 from .base import TaskMetric
+from .confusion import ConfusionMatrix, label_kappa, label_precision_recall_fscore
 
 __all__ = ['POSMetric']
 
 
 class POSMetric(TaskMetric):
-    def __init__(self, mode: str, average='micro', skip_unaligned: bool = True, **kwargs):
+    def __init__(self, mode: str, average='micro', skip_unaligned: bool = True, linear_memory: bool = False,
+                 **kwargs):
         self.mode = mode
         self.average = average
         self.skip_unaligned = skip_unaligned
+        self.linear_memory = linear_memory
+
+        self._confusion = ConfusionMatrix()
 
-        self._a_postags = []
-        self._b_postags = []
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        a_postags, b_postags = self._add(pair if pair is not None else AlignedPair(a, b))
+        return self._score(a_postags, b_postags)
 
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
-        a = [it for it in a if it.isMinimumToken]
-        b = [it for it in b if it.isMinimumToken]
-        alignment = align_items(a, b)
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        self._add(pair if pair is not None else AlignedPair(a, b))
+
+    def _add(self, pair: AlignedPair) -> Tuple[List[str], List[str]]:
         a_postags, b_postags = [], []
-        for items_a, items_b in alignment:
+        for items_a, items_b in pair.alignment:
             if len(items_a) == len(items_b) == 1:
                 a_postags.append(items_a[0].pos)
                 b_postags.append(items_b[0].pos)
@@ -32,21 +37,17 @@ class POSMetric(TaskMetric):
                 if self.skip_unaligned:
                     continue
                 edits = edit_ops([it.pos for it in items_a],
-                                 [it.pos for it in items_b])
+                                 [it.pos for it in items_b],
+                                 linear_memory=self.linear_memory)
                 for postag_a, postag_b in edits:
                     a_postags.append('MISALIGNED' if postag_a is None else postag_a)
                     b_postags.append('MISALIGNED' if postag_b is None else postag_b)
-        score = self._score(a_postags, b_postags)
-        self._a_postags.extend(a_postags)
-        self._b_postags.extend(b_postags)
-        return score
+        self._confusion.add(a_postags, b_postags)
+        return a_postags, b_postags
 
     def _score(self, a_pos, b_pos) -> Dict[str, float]:
         if self.mode == 'reference':
-            prec, rec, f1, _ = \
-                sklearn.metrics.precision_recall_fscore_support(
-                    a_pos, b_pos, average=self.average, zero_division=0
-                )
+            prec, rec, f1 = label_precision_recall_fscore(a_pos, b_pos, self.average)
             return {
                 'precision': prec,
                 'recall': rec,
@@ -54,8 +55,29 @@ class POSMetric(TaskMetric):
             }
         elif self.mode == 'agreement':
             return {
-                'kappa': sklearn.metrics.cohen_kappa_score(a_pos, b_pos)
+                'kappa': label_kappa(a_pos, b_pos)
             }
 
     def aggregate(self) -> Dict[str, float]:
-        return self._score(self._a_postags, self._b_postags)
+        if self.mode == 'reference':
+            prec, rec, f1 = self._confusion.precision_recall_fscore(self.average)
+            return {
+                'precision': prec,
+                'recall': rec,
+                'fscore': f1
+            }
+        elif self.mode == 'agreement':
+            return {
+                'kappa': self._confusion.kappa()
+            }
+
+    def merge(self, other: 'POSMetric') -> 'POSMetric':
+        self._confusion.merge(other._confusion)
+        return self
+
+    def to_counts(self) -> List[Tuple[str, str, int]]:
+        return self._confusion.to_counts()
+
+    def add_counts(self, counts: List[Tuple[str, str, int]], times: int = 1) -> 'POSMetric':
+        self._confusion.add_counts(counts, times)
+        return self
@@ -0,0 +1,104 @@
+import json
+import pickle
+import random
+
+import pytest
+import sklearn.metrics
+
+from segmt_eval.metrics.confusion import ConfusionMatrix, label_accuracy, label_kappa, label_precision_recall_fscore
+
+
+def random_labels(rng, n, labels='ABCDEFG'):
+    a = [rng.choice(labels) for _ in range(n)]
+    b = [x if rng.random() < .7 else rng.choice(labels) for x in a]
+    return a, b
+
+
+@pytest.mark.parametrize('average', ['micro', 'macro', 'weighted'])
+def test_precision_recall_fscore_equals_sklearn(average):
+    rng = random.Random(0)
+    for _ in range(50):
+        a, b = random_labels(rng, rng.randint(1, 40))
+        confusion = ConfusionMatrix()
+        confusion.add(a, b)
+        expected = sklearn.metrics.precision_recall_fscore_support(a, b, average=average, zero_division=0)
+        assert confusion.precision_recall_fscore(average) == expected[:3]
+
+
+def test_kappa_and_accuracy_equal_sklearn():
+    rng = random.Random(1)
+    for _ in range(50):
+        a, b = random_labels(rng, rng.randint(2, 40))
+        confusion = ConfusionMatrix()
+        confusion.add(a, b)
+        # kappa is computed in exact integer arithmetic, sklearn in floating point
+        assert confusion.kappa() == pytest.approx(sklearn.metrics.cohen_kappa_score(a, b), rel=1e-12, abs=1e-12)
+        assert confusion.accuracy() == sklearn.metrics.accuracy_score(a, b)
+
+
+def test_merge_equals_single_matrix():
+    rng = random.Random(2)
+    a, b = random_labels(rng, 100)
+    whole, first, second = ConfusionMatrix(), ConfusionMatrix(), ConfusionMatrix()
+    whole.add(a, b)
+    first.add(a[:50], b[:50])
+    second.add(a[50:][::-1], b[50:][::-1])
+    first.merge(second)
+    assert first.sorted_counts()[0] == whole.sorted_counts()[0]
+    assert (first.sorted_counts()[1] == whole.sorted_counts()[1]).all()
+    assert first.kappa() == whole.kappa()
+
+
+def test_pickle():
+    rng = random.Random(3)
+    a, b = random_labels(rng, 100)
+    whole, first = ConfusionMatrix(), ConfusionMatrix()
+    whole.add(a, b)
+    first.add(a[:50], b[:50])
+    first = pickle.loads(pickle.dumps(first))
+    first.add(a[50:], b[50:])
+    assert first.sorted_counts()[0] == whole.sorted_counts()[0]
+    assert (first.sorted_counts()[1] == whole.sorted_counts()[1]).all()
+    assert first.kappa() == whole.kappa()
+
+
+def test_add_counts():
+    rng = random.Random(4)
+    a, b = random_labels(rng, 100)
+    whole, first, second = ConfusionMatrix(), ConfusionMatrix(), ConfusionMatrix()
+    whole.add(a, b)
+    first.add(a[:50], b[:50])
+    second.add(a[50:], b[50:])
+    counts = json.loads(json.dumps(second.to_counts()))
+    whole.add_counts(counts, 2).add_counts(counts, -3)
+    assert whole.sorted_counts()[0] == first.sorted_counts()[0]
+    assert (whole.sorted_counts()[1] == first.sorted_counts()[1]).all()
+    assert ConfusionMatrix().add_counts(whole.to_counts()).kappa() == first.kappa()
+
+
+def test_sparse_counts():
+    confusion = ConfusionMatrix()
+    confusion.add(['w{}'.format(i) for i in range(5000)], ['w{}'.format(i) for i in range(1, 5001)])
+    assert len(confusion.pairs) == 5000
+    assert confusion.accuracy() == 0
+    assert confusion.kappa() == pytest.approx(sklearn.metrics.cohen_kappa_score(
+        ['w{}'.format(i) for i in range(5000)], ['w{}'.format(i) for i in range(1, 5001)]))
+    confusion.add_counts([('w0', 'w1', 1)], -1)
+    assert confusion.pairs[(confusion.labels.intern('w0'), confusion.labels.intern('w1'))] == 0
+    assert len(confusion.pairs) == 4999
+
+
+def test_empty_matrix():
+    with pytest.raises(ValueError):
+        ConfusionMatrix().kappa()
+
+
+@pytest.mark.parametrize('average', ['micro', 'macro', 'weighted'])
+def test_label_scores_equal_sklearn(average):
+    rng = random.Random(3)
+    for _ in range(50):
+        a, b = random_labels(rng, rng.randint(2, 20))
+        expected = sklearn.metrics.precision_recall_fscore_support(a, b, average=average, zero_division=0)
+        assert label_precision_recall_fscore(a, b, average) == pytest.approx(expected[:3])
+        assert label_kappa(a, b) == pytest.approx(sklearn.metrics.cohen_kappa_score(a, b), nan_ok=True)
+        assert label_accuracy(a, b) == sklearn.metrics.accuracy_score(a, b)
@@ -0,0 +1,63 @@
+import random
+
+from segmt_eval.item import Item
+from segmt_eval.metrics.ner import NERMetric
+from segmt_eval.utils import convert_items_to_bio
+
+NER = ['PER', 'LOC', 'ORG']
+
+
+def make_sentence(rng, n):
+    items, start = [], 0
+    for _ in range(n):
+        ner = [{'ner': rng.choice(NER)}] if rng.random() < .4 else ''
+        items.append(Item(item='w', startOffSet=start, endOffSet=start + 1, pos='NOUN', lemma='w',
+                          isMinimumToken=True, isStopWord=False, ner=ner))
+        start += 2
+    return items
+
+
+def make_corpus(n, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        length = rng.randint(1, 10)
+        corpus.append((make_sentence(rng, length), make_sentence(rng, length + rng.choice([0, 0, 1]))))
+    return corpus
+
+
+def bio_labels(a, b):
+    a_labels, b_labels = convert_items_to_bio(a), convert_items_to_bio(b)
+    m = min(len(a_labels), len(b_labels))
+    return a_labels[:m], b_labels[:m]
+
+
+def test_single_matches_evaluator():
+    metric = NERMetric('reference')
+    for a, b in make_corpus(50):
+        scores = metric.single(a, b)
+        a_labels, b_labels = bio_labels(a, b)
+        labels = set(label[2:] if label != 'O' else label for label in a_labels + b_labels)
+        assert scores == NERMetric.score([a_labels], [b_labels], labels)
+
+
+def test_aggregate_matches_evaluator():
+    corpus = make_corpus(200)
+    metric = NERMetric('reference')
+    for a, b in corpus:
+        metric.update(a, b)
+    a_labels, b_labels = zip(*(bio_labels(a, b) for a, b in corpus))
+    expected = NERMetric.score(list(a_labels), list(b_labels), metric._label_set)
+    assert metric.aggregate() == expected
+
+    merged = NERMetric('reference')
+    for a, b in corpus[:120]:
+        merged.update(a, b)
+    rest = NERMetric('reference')
+    for a, b in corpus[120:]:
+        rest.update(a, b)
+    assert merged.merge(rest).aggregate() == expected
+
+
+def test_aggregate_empty():
+    assert NERMetric('reference').aggregate() == NERMetric.score([], [], {'O'})
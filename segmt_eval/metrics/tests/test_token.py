@@ -0,0 +1,157 @@
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from segmt_eval.evaluator import Evaluator
+from segmt_eval.item import Item, ItemBatch
+from segmt_eval.metrics.token import TokenAgreementMetric, TokenReferenceMetric
+
+
+def boundary_array_reference(items):
+    prev_end = 0
+    masses = []
+    for it in items:
+        start, end = it.startOffSet, it.endOffSet
+        if start > prev_end:
+            masses.append(start - prev_end)
+        masses.append(end - start)
+        prev_end = end
+    arr = np.zeros((sum(masses) - 1,), dtype=bool)
+    pos = 0
+    for mass in masses:
+        curr = pos + mass - 1
+        if curr < sum(masses) - 1:
+            arr[curr] = 1
+        pos += mass
+    return arr
+
+
+def count_edits_reference(ba1, ba2, winlen=1):
+    subs = ba1 ^ ba2
+    trans = []
+    i = 0
+    while i < subs.shape[0]:
+        if not subs[i]:
+            i += 1
+            continue
+        for offs in range(1, winlen + 1):
+            if i + offs >= subs.shape[0]:
+                break
+            if subs[i + offs] and ((ba1[i] and ba2[i + offs]) or (ba2[i] and ba1[i + offs])):
+                trans.append(1 - offs / (winlen + 1))
+                i += offs + 1
+                break
+        i += 1
+    return dict(n_match=(ba1 & ba2).sum(), n_ad=subs.sum() - len(trans) * 2, n_trans=len(trans),
+                w_trans=sum(trans), n_pot_bounds=len(ba1), n_bounds_A=ba1.sum(), n_bounds_B=ba2.sum())
+
+
+def random_items(rng, n):
+    items, start = [], rng.randint(0, 2)
+    for _ in range(n):
+        # mostly adjacent tokens, with some gaps and empty items
+        length = rng.choice([0, 1, 2, 3, 5]) if rng.random() < .1 else rng.randint(1, 6)
+        items.append(Item(item='x' * length, startOffSet=start, endOffSet=start + length, pos='X', lemma='x',
+                          isMinimumToken=True, isStopWord=False, ner=''))
+        start += length + rng.choice([0, 0, 0, 1, 2])
+    return items
+
+
+def test_boundary_array_equals_reference():
+    rng = random.Random(0)
+    for _ in range(500):
+        items = random_items(rng, rng.randint(1, 30))
+        try:
+            expected = boundary_array_reference(items)
+        except (ValueError, IndexError) as e:
+            # too few characters for an array
+            with pytest.raises(type(e)):
+                TokenAgreementMetric._boundary_array(items)
+            continue
+        assert TokenAgreementMetric._boundary_array(items).tolist() == expected.tolist()
+        assert TokenAgreementMetric._boundary_array(ItemBatch.from_items(items)).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('winlen', [0, 1, 2, 3, 5, 40])
+def test_count_edits_equals_reference(winlen):
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        n = int(rng.integers(1, 60))
+        ba1 = rng.random(n) < .3
+        ba2 = ba1 ^ (rng.random(n) < .3)
+        expected = count_edits_reference(ba1, ba2, winlen)
+        assert dict(TokenAgreementMetric._count_edits(ba1, ba2, winlen)) == expected
+
+
+def test_boundary_edits_on_long_documents():
+    rng = random.Random(2)
+    for _ in range(2):
+        length = 20000
+        splits = set(rng.sample(range(1, length), 2000))
+        moved = set(min(length - 1, max(1, x + rng.choice([0, 0, 0, 1, -1, 2]))) for x in splits)
+        a, b = items_from_splits(splits, length), items_from_splits(moved, length)
+        bounds_a, n_pot_bounds = TokenAgreementMetric._boundary_positions(a)
+        bounds_b, _ = TokenAgreementMetric._boundary_positions(b)
+        assert bounds_a.tolist() == sorted(x - 1 for x in splits) and n_pot_bounds == length - 1
+        for winlen in (1, 3):
+            expected = count_edits_reference(boundary_array_reference(a), boundary_array_reference(b), winlen)
+            assert dict(TokenAgreementMetric._count_boundary_edits(bounds_a, bounds_b, n_pot_bounds, winlen)) \
+                == expected
+
+
+def items_from_splits(splits, length):
+    bounds = [0] + sorted(splits) + [length]
+    return [Item(item='x' * (end - start), startOffSet=start, endOffSet=end, pos='X', lemma='x',
+                 isMinimumToken=True, isStopWord=False, ner='') for start, end in zip(bounds, bounds[1:])]
+
+
+def test_winlen_from_evaluator_kwargs():
+    rng = random.Random(1)
+    gold, pred = [], []
+    for _ in range(20):
+        splits = set(rng.sample(range(1, 60), 12))
+        # move some boundaries of pred by up to three characters
+        moved = set(min(59, max(1, x + rng.choice([0, 0, 1, -2, 3]))) for x in splits)
+        gold.append(items_from_splits(splits, 60))
+        pred.append(items_from_splits(moved, 60))
+
+    def kappa(**kwargs):
+        return Evaluator(tasks=['token'], mode='agreement', **kwargs).evaluate(gold, pred)['token']
+
+    assert kappa() == kappa(winlen=1)
+    assert kappa(winlen=3) != kappa(winlen=1)
+    with pytest.raises(ValueError):
+        kappa(winlen=-1)
+
+
+def random_spans(rng, n):
+    # sorted spans with shared starts, and some items appended out of order
+    items, start = [], 0
+    for _ in range(n):
+        length = rng.randint(1, 4)
+        items.append(Item(item='x' * length, startOffSet=start, endOffSet=start + length, pos='X', lemma='x',
+                          isMinimumToken=True, isStopWord=False, ner=''))
+        if rng.random() < .2:
+            items.append(Item(item='x', startOffSet=start, endOffSet=start + 1, pos='X', lemma='x',
+                              isMinimumToken=False, isStopWord=False, ner=''))
+        start += length + rng.choice([0, 1])
+    if items and rng.random() < .3:
+        items.append(items[rng.randrange(len(items))])
+    return items
+
+
+def test_count_matches_equals_merge():
+    rng = random.Random(3)
+    pairs = [(random_spans(rng, rng.randint(0, 15)), random_spans(rng, rng.randint(0, 15))) for _ in range(300)]
+    expected = Counter()
+    for a, b in pairs:
+        expected.update(TokenReferenceMetric()._add(a, b))
+
+    metric = TokenReferenceMetric()
+    metric.update_pairs(pairs[:100], [None] * 100)
+    metric.update_pairs([(ItemBatch.from_items(a), ItemBatch.from_items(b)) for a, b in pairs[100:]], [None] * 200)
+    assert (metric._correct, metric._n_gold, metric._n_pred) == \
+        (expected['correct'], expected['n_gold'], expected['n_pred'])
+    assert metric.aggregate() == TokenReferenceMetric._score(expected)
@@ -1,8 +1,8 @@
-from typing import List, Dict
-from collections import Counter
+from typing import List, Dict, Optional, Sequence, Tuple
 from operator import itemgetter
 
-from segmt_eval.item import Item
+from segmt_eval.alignment import AlignedPair
+from segmt_eval.item import Item, ItemBatch
 import numpy as np
 
 from .base import TaskMetric
@@ -42,7 +42,7 @@ class EditCounter(dict):
             n_ad=self.n_ad + other.n_ad,
             n_trans=self.n_trans + other.n_trans,
             w_trans=self.w_trans + other.w_trans,
-            n_pot_bounds=self.n_pot_bounds + other.pot_bounds,
+            n_pot_bounds=self.n_pot_bounds + other.n_pot_bounds,
             n_bounds_A=self.n_bounds_A + other.n_bounds_A,
             n_bounds_B=self.n_bounds_B + other.n_bounds_B
         )
@@ -70,26 +70,175 @@ class TokenMetric(TaskMetric):
 
 class TokenReferenceMetric(TaskMetric):
     def __init__(self, **kwargs):
-        self._counter = Counter({'correct': 0, 'n_gold': 0, 'n_pred': 0})
+        self._correct = 0
+        self._n_gold = 0
+        self._n_pred = 0
 
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        return TokenReferenceMetric._score(self._add(a, b))
+
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        self._add(a, b)
+
+    def update_pairs(self, pairs: Sequence[Tuple[List[Item], List[Item]]], aligned: Sequence[AlignedPair]):
+        self.update_batch(*TokenReferenceMetric._offset_columns([a for a, _ in pairs]),
+                          *TokenReferenceMetric._offset_columns([b for _, b in pairs]))
+
+    def update_batch(self, sent_a: np.ndarray, starts_a: np.ndarray, ends_a: np.ndarray,
+                     sent_b: np.ndarray, starts_b: np.ndarray, ends_b: np.ndarray):
+        """Add the items of many sentences at once
+
+        Parameters
+        ----------
+        sent_a, sent_b: sentence id of every item, non-decreasing
+        starts_a, ends_a, starts_b, ends_b: offsets of every item, in the order of the items within a sentence
+        """
+        self._correct += TokenReferenceMetric.count_matches(sent_a, starts_a, ends_a, sent_b, starts_b, ends_b)
+        self._n_gold += len(sent_a)
+        self._n_pred += len(sent_b)
+
+    def _add(self, a: List[Item], b: List[Item]) -> Dict[str, int]:
+        starts_a, ends_a = TokenReferenceMetric._offset_lists(a)
+        starts_b, ends_b = TokenReferenceMetric._offset_lists(b)
+        counts = {'correct': TokenReferenceMetric._merge_count(starts_a, ends_a, starts_b, ends_b),
+                  'n_gold': len(a), 'n_pred': len(b)}
+        self._correct += counts['correct']
+        self._n_gold += counts['n_gold']
+        self._n_pred += counts['n_pred']
+        return counts
+
+    def aggregate(self) -> Dict[str, float]:
+        return TokenReferenceMetric._score({'correct': self._correct, 'n_gold': self._n_gold, 'n_pred': self._n_pred})
+
+    def merge(self, other: 'TokenReferenceMetric') -> 'TokenReferenceMetric':
+        self._correct += other._correct
+        self._n_gold += other._n_gold
+        self._n_pred += other._n_pred
+        return self
+
+    def to_counts(self) -> Tuple[int, int, int]:
+        return self._correct, self._n_gold, self._n_pred
+
+    def add_counts(self, counts: Tuple[int, int, int], times: int = 1) -> 'TokenReferenceMetric':
+        correct, n_gold, n_pred = counts
+        self._correct += times * correct
+        self._n_gold += times * n_gold
+        self._n_pred += times * n_pred
+        return self
+
+    @staticmethod
+    def count_matches(sent_a: np.ndarray, starts_a: np.ndarray, ends_a: np.ndarray,
+                      sent_b: np.ndarray, starts_b: np.ndarray, ends_b: np.ndarray) -> int:
+        """Count the items of b with the same span as an item of a in the same sentence
+
+        Items are matched as by walking both sentences in order: among the items of a sentence with the same
+        start, the first of a is matched against the first of b, and so on. This is a join on (sentence, start,
+        rank among the items with that start, end), computed for all sentences at once. Sentences whose starts
+        are not in order on either side are walked one by one.
+
+        Parameters
+        ----------
+        sent_a, sent_b: sentence id of every item, non-decreasing
+        starts_a, ends_a, starts_b, ends_b: offsets of every item, in the order of the items within a sentence
+
+        Returns
+        -------
+        number of matching items
+        """
+        unordered = np.union1d(TokenReferenceMetric._unordered_sentences(sent_a, starts_a),
+                               TokenReferenceMetric._unordered_sentences(sent_b, starts_b))
+        correct = 0
+        if len(unordered):
+            n_sents = int(max(sent_a[-1] if len(sent_a) else 0, sent_b[-1] if len(sent_b) else 0)) + 1
+            is_unordered = np.zeros(n_sents, dtype=bool)
+            is_unordered[unordered] = True
+            bounds_a = np.searchsorted(sent_a, np.stack([unordered, unordered + 1], axis=1)).tolist()
+            bounds_b = np.searchsorted(sent_b, np.stack([unordered, unordered + 1], axis=1)).tolist()
+            lists_a = starts_a.tolist(), ends_a.tolist()
+            lists_b = starts_b.tolist(), ends_b.tolist()
+            for (lo_a, hi_a), (lo_b, hi_b) in zip(bounds_a, bounds_b):
+                correct += TokenReferenceMetric._merge_count(lists_a[0][lo_a:hi_a], lists_a[1][lo_a:hi_a],
+                                                             lists_b[0][lo_b:hi_b], lists_b[1][lo_b:hi_b])
+            keep_a = ~is_unordered[sent_a]
+            keep_b = ~is_unordered[sent_b]
+            sent_a, starts_a, ends_a = sent_a[keep_a], starts_a[keep_a], ends_a[keep_a]
+            sent_b, starts_b, ends_b = sent_b[keep_b], starts_b[keep_b], ends_b[keep_b]
+
+        # each key is unique within a side, so keys that occur twice occur on both sides
+        keys = [np.concatenate(columns) for columns in ((sent_a, sent_b), (starts_a, starts_b),
+                                                        (TokenReferenceMetric._start_ranks(sent_a, starts_a),
+                                                         TokenReferenceMetric._start_ranks(sent_b, starts_b)),
+                                                        (ends_a, ends_b))]
+        packed = TokenReferenceMetric._pack_keys(keys)
+        if packed is not None:
+            packed.sort()
+            return correct + int((packed[1:] == packed[:-1]).sum())
+        order = np.lexsort(keys[::-1])
+        same = np.ones(max(len(order) - 1, 0), dtype=bool)
+        for key in keys:
+            key = key[order]
+            same &= key[1:] == key[:-1]
+        return correct + int(same.sum())
+
+    @staticmethod
+    def _pack_keys(keys: List[np.ndarray]) -> Optional[np.ndarray]:
+        """Combine the key columns into a single int64 per row, or None if they do not fit"""
+        if not len(keys[0]):
+            return keys[0].astype(np.int64)
+        lows = [int(key.min()) for key in keys]
+        sizes = [int(key.max()) - low + 1 for key, low in zip(keys, lows)]
+        if np.prod([float(size) for size in sizes]) >= 2 ** 62:
+            return None
+        packed = np.zeros(len(keys[0]), dtype=np.int64)
+        for key, low, size in zip(keys, lows, sizes):
+            packed *= size
+            packed += key - low
+        return packed
+
+    @staticmethod
+    def _unordered_sentences(sent: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """Ids of the sentences whose starts decrease somewhere"""
+        return np.unique(sent[1:][(sent[1:] == sent[:-1]) & (starts[1:] < starts[:-1])])
+
+    @staticmethod
+    def _start_ranks(sent: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """Rank of every item among the preceding items of its sentence with the same start"""
+        ix = np.arange(len(starts))
+        first = np.ones(len(starts), dtype=bool)
+        first[1:] = (sent[1:] != sent[:-1]) | (starts[1:] != starts[:-1])
+        return ix - np.maximum.accumulate(np.where(first, ix, 0))
+
+    @staticmethod
+    def _merge_count(starts_a: List[int], ends_a: List[int], starts_b: List[int], ends_b: List[int]) -> int:
         a_ix = b_ix = 0
-        counter = Counter({'correct': 0, 'n_gold': len(a), 'n_pred': len(b)})
-        while a_ix < len(a) and b_ix < len(b):
-            if a[a_ix].startOffSet < b[b_ix].startOffSet:
+        correct = 0
+        while a_ix < len(starts_a) and b_ix < len(starts_b):
+            if starts_a[a_ix] < starts_b[b_ix]:
                 a_ix += 1
-            elif a[a_ix].startOffSet > b[b_ix].startOffSet:
+            elif starts_a[a_ix] > starts_b[b_ix]:
                 b_ix += 1
             else:
-                if a[a_ix].endOffSet == b[b_ix].endOffSet:
-                    counter['correct'] += 1
+                if ends_a[a_ix] == ends_b[b_ix]:
+                    correct += 1
                 a_ix += 1
                 b_ix += 1
-        self._counter += counter
-        return TokenReferenceMetric._score(counter)
+        return correct
 
-    def aggregate(self) -> Dict[str, float]:
-        return TokenReferenceMetric._score(self._counter)
+    @staticmethod
+    def _offset_columns(sentences: Sequence[List[Item]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sentence ids and offsets of the items of many sentences"""
+        sent = np.repeat(np.arange(len(sentences)), [len(items) for items in sentences])
+        if sentences and all(isinstance(items, ItemBatch) for items in sentences):
+            return (sent, np.concatenate([items.startOffSet for items in sentences]).astype(np.int64),
+                    np.concatenate([items.endOffSet for items in sentences]).astype(np.int64))
+        return (sent, np.array([it.startOffSet for items in sentences for it in items], dtype=np.int64),
+                np.array([it.endOffSet for items in sentences for it in items], dtype=np.int64))
+
+    @staticmethod
+    def _offset_lists(items: List[Item]) -> Tuple[List[int], List[int]]:
+        if isinstance(items, ItemBatch):
+            return items.startOffSet.tolist(), items.endOffSet.tolist()
+        return [it.startOffSet for it in items], [it.endOffSet for it in items]
 
     @staticmethod
     def _score(counter: Dict[str, int]) -> Dict[str, float]:
@@ -102,22 +251,57 @@ class TokenReferenceMetric(TaskMetric):
 
 
 class TokenAgreementMetric(TaskMetric):
-    def __init__(self, **kwargs):
+    def __init__(self, winlen: int = 1, **kwargs):
+        """
+        winlen: size of the window for transpositions, i.e. the largest distance in characters at which two
+            boundaries placed differently by a and b count as a (partially) matching transposition
+        """
+        if winlen < 0:
+            raise ValueError(f'winlen must not be negative, got {winlen}')
+        self.winlen = winlen
         self._edit_counts = EditCounter()
 
-    def single(self, a: List[Item], b: List[Item]) -> Dict[str, float]:
-        a = [it for it in a if it.isMinimumToken]
-        b = [it for it in b if it.isMinimumToken]
-        boundaries_a = TokenAgreementMetric._boundary_array(a)
-        boundaries_b = TokenAgreementMetric._boundary_array(b)
-        edit_counts = TokenAgreementMetric._count_edits(boundaries_a, boundaries_b)
-        score = TokenAgreementMetric._boundary_edit_kappa(edit_counts)
+    def single(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None) -> Dict[str, float]:
+        edit_counts = self._add(pair if pair is not None else AlignedPair(a, b))
+        if edit_counts is None:
+            return {}
+        return TokenAgreementMetric._boundary_edit_kappa(edit_counts)
+
+    def update(self, a: List[Item], b: List[Item], pair: Optional[AlignedPair] = None):
+        self._add(pair if pair is not None else AlignedPair(a, b))
+
+    def _add(self, pair: AlignedPair) -> Optional[EditCounter]:
+        try:
+            boundaries_a, n_pot_bounds = TokenAgreementMetric._boundary_positions(pair.min_a)
+            boundaries_b, n_pot_bounds_b = TokenAgreementMetric._boundary_positions(pair.min_b)
+        except (ValueError, IndexError):
+            if pair.tolerant:
+                return None
+            raise
+        if n_pot_bounds != n_pot_bounds_b:
+            if pair.tolerant:
+                # boundaries cannot be compared, the sentence is reported by the alignment task
+                return None
+            raise ValueError(f'sentences span {n_pot_bounds + 1} and {n_pot_bounds_b + 1} characters')
+        edit_counts = TokenAgreementMetric._count_boundary_edits(boundaries_a, boundaries_b, n_pot_bounds,
+                                                                 self.winlen)
         self._edit_counts += edit_counts
-        return score
+        return edit_counts
 
     def aggregate(self) -> Dict[str, float]:
         return TokenAgreementMetric._boundary_edit_kappa(self._edit_counts)
 
+    def merge(self, other: 'TokenAgreementMetric') -> 'TokenAgreementMetric':
+        self._edit_counts += other._edit_counts
+        return self
+
+    def to_counts(self) -> Dict[str, float]:
+        return dict(self._edit_counts)
+
+    def add_counts(self, counts: Dict[str, float], times: int = 1) -> 'TokenAgreementMetric':
+        self._edit_counts += EditCounter(**{key: times * value for key, value in counts.items()})
+        return self
+
     @staticmethod
     def _boundary_edit_kappa(edit_counts: EditCounter) -> Dict[str, float]:
         """Calculate the boundary agreement based on a set of edits
@@ -152,31 +336,84 @@ class TokenAgreementMetric(TaskMetric):
         EditCounter
 
         """
-        subs = ba1 ^ ba2
-        trans = []
-        i = 0
-        while i < subs.shape[0]:
-            if not subs[i]:
-                i += 1
-                continue
-            for offs in range(1, winlen + 1):
-                if i + offs >= subs.shape[0]:
-                    break
-                if subs[i + offs] and ((ba1[i] and ba2[i + offs]) or (ba2[i] and ba1[i + offs])):
-                    trans.append(1 - offs / (winlen + 1))
-                    i += offs + 1
-                    break
-            i += 1
+        if ba1.shape != ba2.shape:
+            raise ValueError(f'boundary arrays of shapes {ba1.shape} and {ba2.shape}')
+        return TokenAgreementMetric._count_boundary_edits(np.flatnonzero(ba1), np.flatnonzero(ba2), len(ba1), winlen)
+
+    @staticmethod
+    def _count_boundary_edits(bounds_a: np.ndarray, bounds_b: np.ndarray, n_pot_bounds: int,
+                              winlen: int = 1) -> EditCounter:
+        """Count the edits needed to align the boundaries at positions bounds_a and bounds_b
+
+        Parameters
+        ----------
+        bounds_a, bounds_b: sorted, unique boundary positions, see `_boundary_positions`
+        n_pot_bounds: number of potential boundary positions
+        winlen: size of the window for transpositions
+
+        Returns
+        -------
+        EditCounter
+        """
+        in_b = TokenAgreementMetric._sorted_membership(bounds_a, bounds_b)
+        in_a = TokenAgreementMetric._sorted_membership(bounds_b, bounds_a)
+        subs_a = bounds_a[~in_b]
+        subs_b = bounds_b[~in_a]
+        trans = TokenAgreementMetric._transpositions(subs_a, subs_b, winlen)
         return EditCounter(
-            n_match=(ba1 & ba2).sum(),
-            n_ad=subs.sum() - len(trans) * 2,
+            n_match=len(bounds_a) - len(subs_a),
+            n_ad=len(subs_a) + len(subs_b) - len(trans) * 2,
             n_trans=len(trans),
             w_trans=sum(trans),
-            n_pot_bounds=len(ba1),
-            n_bounds_A=ba1.sum(),
-            n_bounds_B=ba2.sum()
+            n_pot_bounds=n_pot_bounds,
+            n_bounds_A=len(bounds_a),
+            n_bounds_B=len(bounds_b)
         )
 
+    @staticmethod
+    def _sorted_membership(x: np.ndarray, sorted_y: np.ndarray) -> np.ndarray:
+        """Boolean mask of the values of x that are in sorted_y"""
+        if not len(sorted_y):
+            return np.zeros(len(x), dtype=bool)
+        ix = np.minimum(np.searchsorted(sorted_y, x), len(sorted_y) - 1)
+        return sorted_y[ix] == x
+
+    @staticmethod
+    def _transpositions(subs_a: np.ndarray, subs_b: np.ndarray, winlen: int = 1) -> List[float]:
+        """Find the transpositions between the boundaries only placed by one side
+
+        Parameters
+        ----------
+        subs_a, subs_b: sorted positions of the boundaries only in a, and only in b
+        winlen: size of the window for transpositions
+
+        Returns
+        -------
+        weight of each transposition, from left to right
+        """
+        if not len(subs_a) or not len(subs_b):
+            return []
+
+        # the partner of a substitution is the first substitution of the other side that follows it,
+        # if it is at most winlen positions away
+        def distance_to_next(subs, other):
+            following = np.append(other, np.iinfo(np.int64).max)[np.searchsorted(other, subs, side='right')]
+            return following - subs
+
+        positions = np.concatenate((subs_a, subs_b))
+        offsets = np.concatenate((distance_to_next(subs_a, subs_b), distance_to_next(subs_b, subs_a)))
+        candidates = np.flatnonzero(offsets <= winlen)
+        candidates = candidates[np.argsort(positions[candidates], kind='stable')]
+        # transpositions are taken from left to right, each skipping the position after its partner
+        trans = []
+        next_i = 0
+        for i, offs in zip(positions[candidates].tolist(), offsets[candidates].tolist()):
+            if i < next_i:
+                continue
+            trans.append(1 - offs / (winlen + 1))
+            next_i = i + offs + 2
+        return trans
+
     @staticmethod
     def _boundary_array(items: List[Item]) -> np.ndarray:
         """Convert an item list into an array of boundary marks
@@ -189,21 +426,45 @@ class TokenAgreementMetric(TaskMetric):
         -------
         boolean array of length of number of characters - 1. each true value marks a boundary
         """
-        # get masses
-        prev_end = 0
-        masses = []
-        for it in items:
-            start, end = it.startOffSet, it.endOffSet
-
-            if start > prev_end:
-                masses.append(start - prev_end)
-            masses.append(end - start)
-            prev_end = end
-        arr = np.zeros((sum(masses) - 1,), dtype=np.bool)
-        pos = 0
-        for mass in masses:
-            curr = pos + mass - 1
-            if curr < sum(masses) - 1:
-                arr[curr] = 1
-            pos += mass
+        positions, n_pos = TokenAgreementMetric._boundary_positions(items)
+        arr = np.zeros((n_pos,), dtype=bool)
+        arr[positions] = 1
         return arr
+
+    @staticmethod
+    def _boundary_positions(items: List[Item]) -> Tuple[np.ndarray, int]:
+        """Find the boundary positions of an item list, i.e. the true values of `_boundary_array`
+
+        Parameters
+        ----------
+        items: list of items
+
+        Returns
+        -------
+        sorted, unique boundary positions and the number of potential boundary positions (characters - 1)
+        """
+        starts, ends = TokenAgreementMetric._offset_arrays(items)
+        lengths = ends - starts
+        gaps = starts - np.concatenate(([0], ends[:-1]))
+        # masses are the item lengths and the gaps before them. cumulative mass after every item, and before
+        # every item that follows a gap
+        after = np.cumsum(np.maximum(gaps, 0) + lengths)
+        before = after - lengths
+        n_pos = int(after[-1]) - 1 if len(after) else -1
+        if n_pos < 0:
+            raise ValueError('cannot mark boundaries in an empty sentence')
+        # each mass ends with a boundary, except at the last position; empty masses wrap around as in indexing
+        curr = np.concatenate((before[gaps > 0], after)) - 1
+        curr = curr[curr < n_pos]
+        curr[curr < 0] += n_pos
+        if len(curr) and curr.min() < 0:
+            raise IndexError('boundary before the start of the sentence')
+        curr.sort()
+        return np.concatenate((curr[:1], curr[1:][curr[1:] != curr[:-1]])), n_pos
+
+    @staticmethod
+    def _offset_arrays(items: List[Item]) -> Tuple[np.ndarray, np.ndarray]:
+        if isinstance(items, ItemBatch):
+            return items.startOffSet.astype(np.int64), items.endOffSet.astype(np.int64)
+        return (np.array([it.startOffSet for it in items], dtype=np.int64),
+                np.array([it.endOffSet for it in items], dtype=np.int64))
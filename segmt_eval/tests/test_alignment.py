@@ -0,0 +1,23 @@
+from segmt_eval.alignment import AlignedPair
+from segmt_eval.item import Item
+
+
+def make_item(text, start, minimum=True):
+    return Item(item=text, startOffSet=start, endOffSet=start + len(text), pos='X', lemma=text,
+                isMinimumToken=minimum, isStopWord=False, ner='')
+
+
+def test_aligned_pair_filters_minimum_tokens():
+    a = [make_item('de', 0), make_item('kat', 3), make_item('de kat', 0, minimum=False)]
+    b = [make_item('de', 0), make_item('ka', 3), make_item('t', 5)]
+    pair = AlignedPair(a, b)
+    assert pair.min_a == a[:2]
+    assert pair.min_b == b
+    assert pair.alignment == [([a[0]], [b[0]]), ([a[1]], [b[1], b[2]])]
+
+
+def test_aligned_pair_is_computed_once():
+    a = [make_item('de', 0)]
+    pair = AlignedPair(a, a)
+    assert pair.alignment is pair.alignment
+    assert pair.min_a is pair.min_a
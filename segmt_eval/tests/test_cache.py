@@ -0,0 +1,34 @@
+from segmt_eval.cache import SegmenterCache
+
+
+def test_cache_get_put(tmp_path):
+    with SegmenterCache(tmp_path / 'cache.sqlite') as cache:
+        assert cache.get('v1', 'query') is None
+        cache.put('v1', 'query', '[{"item": "query"}]')
+        assert cache.get('v1', 'query') == '[{"item": "query"}]'
+        assert cache.get('v2', 'query') is None
+        cache.put('v1', 'query', '[]')
+        assert cache.get('v1', 'query') == '[]'
+        assert len(cache) == 1
+
+    with SegmenterCache(tmp_path / 'cache.sqlite') as cache:
+        assert cache.get('v1', 'query') == '[]'
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    outputs = {'q{}'.format(i): 'x{}'.format(i) * 50 for i in range(10)}
+    with SegmenterCache(tmp_path / 'cache.sqlite') as cache:
+        for query, output in outputs.items():
+            cache.put('v1', query, output)
+        cache.max_bytes = cache.size
+        # q0 is used again, so q1 is the least recently used
+        assert cache.get('v1', 'q0') == outputs['q0']
+        cache.put('v1', 'q10', 'x10' * 50)
+        assert cache.size <= cache.max_bytes
+        assert cache.get('v1', 'q1') is None
+        assert cache.get('v1', 'q0') == outputs['q0']
+        size, n_outputs = cache.size, len(cache)
+
+    with SegmenterCache(tmp_path / 'cache.sqlite', max_bytes=size) as cache:
+        assert cache.size == size
+        assert len(cache) == n_outputs
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+
+from segmt_eval.corpus import convert_to_columnar, load_columnar, save_columnar
+from segmt_eval.evaluator import Evaluator
+from segmt_eval.item import Item
+from segmt_eval.tests.test_evaluator import make_corpus
+from segmt_eval.utils import iter_sentence_pairs
+
+ITEMS = [
+    Item('Mark', 0, 4, 'PROPN', 'mark', True, False, ''),
+    Item('Rutte', 5, 10, 'PROPN', 'rutte', True, True, ''),
+    Item('Mark Rutte', 0, 10, 'PROPN', 'mark rutte', False, False, [{'ner': 'PER'}]),
+]
+
+
+def test_columnar_round_trip(tmp_path):
+    sentences = [ITEMS, [], ITEMS[1:]]
+    save_columnar(sentences, tmp_path)
+    for mmap in (True, False):
+        corpus = load_columnar(tmp_path, mmap=mmap)
+        assert len(corpus) == 3
+        assert [batch.to_items() for batch in corpus] == sentences
+        assert corpus[-1].to_items() == ITEMS[1:]
+        assert [batch.to_items() for batch in corpus[1:]] == sentences[1:]
+    assert isinstance(load_columnar(tmp_path).columns['startOffSet'], np.memmap)
+
+    save_columnar([], tmp_path / 'empty')
+    assert len(load_columnar(tmp_path / 'empty')) == 0
+
+
+def as_dict(item):
+    return {field: getattr(item, field) for field in item.__slots__}
+
+
+def test_evaluate_columnar_equals_json(tmp_path):
+    gold, pred = make_corpus(100)
+    records = [{'query': '', 'gold': [as_dict(it) for it in a], 'pred': [as_dict(it) for it in b]}
+               for a, b in zip(gold, pred)]
+    data_path = tmp_path / 'eval.json'
+    data_path.write_text(json.dumps(records))
+    gold_path, pred_path = convert_to_columnar(data_path, tmp_path / 'columnar')
+
+    for mode in ('reference', 'agreement'):
+        evaluator = Evaluator(['token', 'pos', 'lemma'], mode=mode, skip_unaligned=False)
+        assert evaluator.evaluate_columnar(gold_path, pred_path) == \
+            evaluator.evaluate_pairs(iter_sentence_pairs(data_path))
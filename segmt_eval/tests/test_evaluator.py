@@ -0,0 +1,81 @@
+import itertools
+import json
+import random
+
+from segmt_eval.evaluator import Evaluator
+from segmt_eval.item import Item
+
+POS = ['NOUN', 'VERB', 'ADP', 'DET', 'ADJ']
+NER = ['PER', 'LOC', 'ORG']
+
+
+def make_item(rng, word, start):
+    ner = [{'ner': rng.choice(NER)}] if rng.random() < .2 else ''
+    return Item(item=word, startOffSet=start, endOffSet=start + len(word), pos=rng.choice(POS),
+                lemma=word.lower(), isMinimumToken=True, isStopWord=False, ner=ner)
+
+
+def make_corpus(n, seed=0):
+    rng = random.Random(seed)
+    gold, pred = [], []
+    for _ in range(n):
+        a, b, start = [], [], 0
+        for _ in range(rng.randint(1, 12)):
+            word = ''.join(rng.choice('abcde') for _ in range(rng.randint(1, 6)))
+            a.append(make_item(rng, word, start))
+            if len(word) > 1 and rng.random() < .1:
+                # split the word to get a misaligned span
+                b.append(make_item(rng, word[:1], start))
+                b.append(make_item(rng, word[1:], start + 1))
+            else:
+                b.append(make_item(rng, word, start))
+            start += len(word) + 1
+        gold.append(a)
+        pred.append(b)
+    return gold, pred
+
+
+def test_evaluate_parallel_equals_serial():
+    gold, pred = make_corpus(200)
+    for mode, tasks in (('reference', ['token', 'pos', 'lemma', 'ner']), ('agreement', ['token', 'pos', 'lemma'])):
+        serial = Evaluator(tasks, mode=mode, skip_unaligned=False).evaluate(gold, pred)
+        parallel = Evaluator(tasks, mode=mode, workers=2, chunk_size=17,
+                             skip_unaligned=False).evaluate(gold, pred)
+        assert parallel == serial
+
+
+def test_evaluate_tolerant():
+    gold, pred = make_corpus(50)
+    # truncated and empty predictions
+    pred[3] = pred[3][:-1]
+    pred[7] = []
+    for mode in ('reference', 'agreement'):
+        result = Evaluator(['token', 'pos', 'lemma'], mode=mode, tolerant=True,
+                           skip_unaligned=False).evaluate(gold, pred)
+        assert result['alignment']['sentences'] == 50
+        assert result['alignment']['irregular_sentences'] == result['alignment']['span_mismatch'] == 2
+
+    # sentences that cannot be compared are left out of the token agreement
+    regular = [i for i in range(50) if i not in (3, 7)]
+    expected = Evaluator(['token'], mode='agreement').evaluate([gold[i] for i in regular], [pred[i] for i in regular])
+    assert result['token'] == expected['token']
+
+
+def test_evaluate_incremental(tmp_path):
+    gold, pred = make_corpus(100)
+    state_path = tmp_path / 'state.json'
+    tasks = {'reference': ['token', 'pos', 'lemma', 'ner', 'alignment'], 'agreement': ['token', 'pos', 'lemma']}
+    for (mode, tasks), workers in itertools.product(tasks.items(), (1, 2)):
+        evaluator = Evaluator(tasks, mode=mode, workers=workers, chunk_size=7, skip_unaligned=False)
+        assert evaluator.evaluate_incremental(zip(gold, pred), state_path) == evaluator.evaluate(gold, pred)
+        with open(state_path) as state_file:
+            assert len(json.load(state_file)['pairs']) == len(gold)
+
+        # change a few predictions, drop some sentences and repeat others
+        changed = [[make_item(random.Random(i), it.item.upper(), it.startOffSet) for it in b] if i % 10 == 0 else b
+                   for i, b in enumerate(pred)]
+        new_gold, new_pred = gold[5:] + gold[:3], changed[5:] + changed[:3]
+        assert evaluator.evaluate_incremental(zip(new_gold, new_pred), state_path) == \
+            evaluator.evaluate(new_gold, new_pred)
+        assert evaluator.evaluate_incremental(zip(gold, pred), state_path) == \
+            evaluator.evaluate(gold, pred)
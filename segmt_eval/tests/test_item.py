@@ -0,0 +1,35 @@
+import pickle
+
+from segmt_eval.item import Item, ItemBatch, StringTable
+
+ITEMS = [
+    Item('Mark', 0, 4, 'PROPN', 'mark', True, False, ''),
+    Item('Rutte', 5, 10, 'PROPN', 'rutte', True, False, ''),
+    Item('Mark Rutte', 0, 10, 'PROPN', 'mark rutte', False, False, [{'ner': 'PER'}]),
+]
+
+
+def test_item_has_no_dict():
+    assert not hasattr(ITEMS[0], '__dict__')
+    assert pickle.loads(pickle.dumps(ITEMS[2])) == ITEMS[2]
+
+
+def test_item_batch_round_trip():
+    batch = ItemBatch.from_items(ITEMS)
+    assert len(batch) == 3
+    assert batch.to_items() == ITEMS
+    assert list(batch) == ITEMS
+    assert batch[2] == ITEMS[2]
+    assert batch.startOffSet.tolist() == [0, 5, 0]
+
+
+def test_item_batch_minimum_tokens():
+    batch = ItemBatch.from_items(ITEMS).minimum_tokens()
+    assert batch.to_items() == ITEMS[:2]
+
+
+def test_item_batch_shares_table():
+    table = StringTable()
+    a = ItemBatch.from_items(ITEMS[:1], table)
+    b = ItemBatch.from_items(ITEMS[:2], table)
+    assert a.pos[0] == b.pos[1] == table.intern('PROPN')
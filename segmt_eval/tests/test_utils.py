@@ -0,0 +1,340 @@
+import json
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from segmt_eval.cache import SegmenterCache
+from segmt_eval.item import Item, ItemBatch
+from segmt_eval.utils import align_items, align_items_tolerant, align_offsets, compose_evaluation_data, edit_ops, \
+    iter_json, iter_sentence_pairs, itemize_corpus, _edit_backpointers, _edit_backpointers_small
+
+
+def test_edit_ops_unequal_length():
+    A = ['NOUN', 'ADP', 'NOUN']
+    B = ['NOUN', 'VERB']
+    expected = [('NOUN', 'NOUN'), ('ADP', 'VERB'), ('NOUN', None)]
+    assert edit_ops(A, B) == expected
+
+
+def test_edit_ops_extra_item():
+    assert edit_ops(['a'], ['a', 'b']) == [('a', 'a'), (None, 'b')]
+
+
+def test_edit_ops_empty():
+    assert edit_ops([], ['a', 'b']) == [(None, 'a'), (None, 'b')]
+    assert edit_ops(['a'], []) == [('a', None)]
+    assert edit_ops([], []) == []
+
+
+def test_edit_backpointers_paths_agree():
+    rng = random.Random(0)
+    for _ in range(500):
+        A = [rng.choice('abcd') for _ in range(rng.randint(0, 30))]
+        B = [rng.choice('abcd') for _ in range(rng.randint(0, 30))]
+        assert _edit_backpointers(A, B).tolist() == _edit_backpointers_small(A, B)
+
+
+def test_edit_ops_long_span():
+    A = ['x'] * 600
+    B = ['y'] * 300 + ['x'] * 600
+    assert edit_ops(A, B) == [(None, 'y')] * 300 + [('x', 'x')] * 600
+
+
+def test_edit_ops_linear_memory():
+    rng = random.Random(0)
+    A = [rng.choice('abcdef') for _ in range(400)]
+    B = [x if rng.random() < .8 else 'z' for x in A][5:]
+    edits = edit_ops(A, B, linear_memory=True)
+    assert [x for x, _ in edits if x is not None] == A
+    assert [y for _, y in edits if y is not None] == B
+
+    def cost(edits):
+        return sum(1 for x, y in edits if x != y)
+
+    assert cost(edits) == cost(edit_ops(A, B))
+
+
+def segment(splits, gaps):
+    # split a text of `gaps` separated words into tokens at the given character offsets
+    items, start = [], 0
+    for end in sorted(splits):
+        if end in gaps:
+            items.append(Item('x' * (end - start), start, end, 'X', 'x', True, False, ''))
+            start = end + 1
+        elif end > start:
+            items.append(Item('x' * (end - start), start, end, 'X', 'x', True, False, ''))
+            start = end
+    return items
+
+
+def random_segmentations(rng, length):
+    gaps = set(rng.sample(range(1, length - 1), length // 6))
+    words = sorted(gaps | {length})
+    a = segment(set(words) | set(rng.sample(range(1, length), length // 5)) - {g + 1 for g in gaps}, gaps)
+    b = segment(set(words) | set(rng.sample(range(1, length), length // 5)) - {g + 1 for g in gaps}, gaps)
+    return a, b
+
+
+def align_items_reference(a, b):
+    a = sorted(a, key=lambda it: (it.startOffSet, -it.endOffSet))
+    b = sorted(b, key=lambda it: (it.startOffSet, -it.endOffSet))
+    result, a_ix, b_ix, char_ix, curr_pair = [], 0, 0, a[0].startOffSet, ([], [])
+    while char_ix < max(it.endOffSet for it in a):
+        curr_a, curr_b = a[a_ix], b[b_ix]
+        if char_ix < min(curr_a.startOffSet, curr_b.startOffSet):
+            char_ix += 1
+        elif curr_a.endOffSet == curr_b.endOffSet:
+            curr_pair[0].append(curr_a)
+            curr_pair[1].append(curr_b)
+            result.append(curr_pair)
+            curr_pair, char_ix, a_ix, b_ix = ([], []), curr_a.endOffSet, a_ix + 1, b_ix + 1
+        elif curr_a.endOffSet < curr_b.endOffSet:
+            curr_pair[0].append(curr_a)
+            char_ix, a_ix = curr_a.endOffSet, a_ix + 1
+        else:
+            curr_pair[1].append(curr_b)
+            char_ix, b_ix = curr_b.endOffSet, b_ix + 1
+    return result
+
+
+def test_align_items_equals_reference():
+    rng = random.Random(0)
+    for _ in range(200):
+        a, b = random_segmentations(rng, rng.randint(3, 80))
+        expected = align_items_reference(a, b)
+        assert align_items(a, b) == expected
+        assert align_items(rng.sample(a, len(a)), b[::-1]) == expected
+        assert align_items(ItemBatch.from_items(a), ItemBatch.from_items(b)) == expected
+
+
+def test_align_items_different_span():
+    a = [Item('ab', 0, 2, 'X', 'ab', True, False, '')]
+    b = [Item('a', 0, 1, 'X', 'a', True, False, '')]
+    with pytest.raises(ValueError):
+        align_items(a, b)
+    with pytest.raises(ValueError):
+        align_items(a, [])
+
+
+def test_align_items_tolerant_equals_align_items():
+    rng = random.Random(2)
+    for _ in range(200):
+        a, b = random_segmentations(rng, rng.randint(3, 80))
+        alignment, issues = align_items_tolerant(rng.sample(a, len(a)), b)
+        assert alignment == align_items(a, b)
+        assert not issues
+        assert align_items(a, b, tolerant=True) == alignment
+
+
+def test_align_items_tolerant_irregular():
+    def item(start, end):
+        return Item('x' * (end - start), start, end, 'X', 'x', True, False, '')
+
+    # leading and trailing text covered by a single side
+    a = [item(0, 3), item(4, 6), item(7, 9)]
+    b = [item(4, 6), item(7, 9), item(10, 12)]
+    alignment, issues = align_items_tolerant(a, b)
+    assert alignment == [([a[0]], []), ([a[1]], [b[0]]), ([a[2]], [b[1]]), ([], [b[2]])]
+    assert issues == {'span_mismatch': 1, 'uncovered': 2}
+
+    # a multi-word item next to its own parts
+    a = [item(0, 5), item(0, 2), item(2, 5), item(6, 8)]
+    b = [item(0, 5), item(6, 8)]
+    alignment, issues = align_items_tolerant(a, b)
+    assert alignment == [(a[:3], [b[0]]), ([a[3]], [b[1]])]
+    assert issues == {'overlapping': 2}
+
+    alignment, issues = align_items_tolerant(a, [])
+    assert alignment == [(a[:3], []), ([a[3]], [])]
+    assert issues == {'span_mismatch': 1, 'uncovered': 2, 'overlapping': 2}
+
+
+def test_align_offsets_equals_align_items():
+    rng = random.Random(1)
+    sentences = [random_segmentations(rng, rng.randint(3, 80)) for _ in range(100)]
+    columns = []
+    for side in (0, 1):
+        items = [sent[side] for sent in sentences]
+        columns += [np.repeat(np.arange(len(items)), [len(x) for x in items]),
+                    np.array([it.startOffSet for x in items for it in x]),
+                    np.array([it.endOffSet for x in items for it in x])]
+    alignment_a, alignment_b = align_offsets(*columns)
+
+    expected_a, expected_b, n_alignments = [], [], 0
+    for a, b in sentences:
+        for items_a, items_b in align_items(a, b):
+            expected_a += [n_alignments] * len(items_a)
+            expected_b += [n_alignments] * len(items_b)
+            n_alignments += 1
+    assert alignment_a.tolist() == expected_a
+    assert alignment_b.tolist() == expected_b
+
+    with pytest.raises(ValueError):
+        align_offsets(np.array([0, 0]), np.array([0, 2]), np.array([2, 4]),
+                      np.array([0]), np.array([0]), np.array([2]))
+
+
+def test_iter_json_array_and_lines(tmp_path):
+    records = [{'query': 'q{}'.format(i), 'gold': [], 'pred': [{'item': 'x' * i}]} for i in range(50)]
+    array_file = tmp_path / 'data.json'
+    array_file.write_text(json.dumps(records, indent=2), encoding='utf8')
+    lines_file = tmp_path / 'data.jsonl'
+    lines_file.write_text('\n'.join(json.dumps(r) for r in records) + '\n', encoding='utf8')
+    for path in (array_file, lines_file):
+        assert list(iter_json(path, chunk_size=7)) == records
+        assert list(iter_json(path)) == records
+
+
+def test_itemize_corpus(tmp_path, monkeypatch):
+    item = {'item': 'Mark', 'startOffSet': 0, 'endOffSet': 4, 'pos': 'PROPN', 'lemma': 'mark',
+            'isMinimumToken': True}
+    records = [{'query': 'Mark', 'gold': [item], 'pred': [dict(item, isStopWord=True, ner=[{'ner': 'PER'}])]},
+               {'query': '', 'gold': [], 'pred': []}]
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(records), encoding='utf8')
+
+    gold, pred = zip(*iter_sentence_pairs(path))
+    assert gold[0] == [Item('Mark', 0, 4, 'PROPN', 'mark', True, False, '')]
+    assert pred[0] == [Item('Mark', 0, 4, 'PROPN', 'mark', True, True, [{'ner': 'PER'}])]
+    assert itemize_corpus(path) == (list(gold), list(pred))
+    gold_batches, pred_batches = itemize_corpus(path, columnar=True)
+    assert [batch.to_items() for batch in pred_batches] == list(pred)
+    lines_path = tmp_path / 'data.jsonl'
+    lines_path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf8')
+    assert itemize_corpus(lines_path) == (list(gold), list(pred))
+    monkeypatch.setattr('segmt_eval.utils.orjson', None)
+    assert itemize_corpus(path) == (list(gold), list(pred))
+    assert itemize_corpus(lines_path) == (list(gold), list(pred))
+
+
+def test_iter_json_truncated(tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text('[{"a": 1}, {"a": ', encoding='utf8')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json(path, chunk_size=4))
+
+
+def test_iter_json_cut_off_anywhere(tmp_path):
+    records = [{'s': 'caf\u00e9 \\ "q"' * i, 'n': [1.5e-3, -12, True, False, None], 'u': '\u2028\U0001f600'}
+               for i in range(5)]
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(records), encoding='utf8')
+    for chunk_size in range(1, 40):
+        assert list(iter_json(path, chunk_size=chunk_size)) == records
+
+
+def test_iter_json_malformed_record(tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text('[{"a": 1}, {"a" 2}, ' + ', '.join(['{"a": "xxxxxxxxxx"}'] * 100000) + ']', encoding='utf8')
+    with pytest.raises(json.JSONDecodeError) as err:
+        list(iter_json(path, chunk_size=64))
+    # raised on the malformed record, without buffering the rest of the file
+    assert len(err.value.doc) < 1000
+
+
+class FakeSegmenter:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def segment(self, query):
+        if query == self.fail_on:
+            raise RuntimeError('segmenter is down')
+        with self.lock:
+            self.queries.append(query)
+        return json.dumps([{'item': word} for word in query.split()])
+
+
+class FakeBatchSegmenter(FakeSegmenter):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def segment_batch(self, queries):
+        with self.lock:
+            self.batches.append(len(queries))
+        return [self.segment(query) for query in queries]
+
+
+def test_compose_evaluation_data(tmp_path):
+    gold_path, save_path = tmp_path / 'gold.json', tmp_path / 'eval.json'
+    records = [{'query': 'q{} w{}'.format(i, i), 'gold': []} for i in range(40)]
+    records[3]['expanded_query'] = 'expanded'
+    gold_path.write_text(json.dumps(records))
+    expected = [dict(q, pred=[{'item': word} for word in q.get('expanded_query', q['query']).split()])
+                for q in records]
+
+    for kwargs in ({}, {'workers': 4}, {'workers': 4, 'batch_size': 3, 'max_in_flight': 2}):
+        segmenter = FakeSegmenter()
+        compose_evaluation_data(segmenter, gold_path, save_path, **kwargs)
+        assert json.loads(save_path.read_text()) == expected
+        assert len(segmenter.queries) == 40
+
+    segmenter = FakeBatchSegmenter()
+    compose_evaluation_data(segmenter, gold_path, save_path, workers=2, batch_size=16)
+    assert json.loads(save_path.read_text()) == expected
+    assert sorted(segmenter.batches) == [8, 16, 16]
+
+
+def test_compose_evaluation_data_resumes(tmp_path):
+    gold_path, save_path, checkpoint_path = tmp_path / 'gold.json', tmp_path / 'eval.json', tmp_path / 'ckpt.jsonl'
+    records = [{'query': 'q{}'.format(i), 'gold': []} for i in range(30)]
+    gold_path.write_text(json.dumps(records))
+
+    with pytest.raises(RuntimeError):
+        compose_evaluation_data(FakeSegmenter(fail_on='q20'), gold_path, save_path, checkpoint_path=checkpoint_path)
+    assert not save_path.exists()
+    # a record cut off by the interruption
+    with open(checkpoint_path, 'a') as checkpoint:
+        checkpoint.write('{"index": 20, "pr')
+
+    segmenter = FakeSegmenter()
+    compose_evaluation_data(segmenter, gold_path, save_path, workers=3, checkpoint_path=checkpoint_path)
+    assert sorted(segmenter.queries) == sorted('q{}'.format(i) for i in range(20, 30))
+    assert json.loads(save_path.read_text()) == [dict(q, pred=[{'item': q['query']}]) for q in records]
+    # 20 records, the cut off one and the 10 resumed
+    assert len(checkpoint_path.read_text().splitlines()) == 31
+
+
+def test_compose_evaluation_data_stale_checkpoint(tmp_path):
+    gold_path, save_path, checkpoint_path = tmp_path / 'gold.json', tmp_path / 'eval.json', tmp_path / 'ckpt.jsonl'
+    records = [{'query': 'q{}'.format(i), 'gold': []} for i in range(30)]
+    gold_path.write_text(json.dumps(records))
+    compose_evaluation_data(FakeSegmenter(), gold_path, save_path, checkpoint_path=checkpoint_path)
+
+    # the gold file is edited and shortened: only the records of unchanged queries are reused
+    records = [{'query': 'x{}'.format(i) if i % 5 == 0 else 'q{}'.format(i), 'gold': []} for i in range(20)]
+    gold_path.write_text(json.dumps(records))
+    segmenter = FakeSegmenter()
+    compose_evaluation_data(segmenter, gold_path, save_path, checkpoint_path=checkpoint_path)
+    assert sorted(segmenter.queries) == ['x0', 'x10', 'x15', 'x5']
+    assert json.loads(save_path.read_text()) == [dict(q, pred=[{'item': q['query']}]) for q in records]
+
+
+def test_compose_evaluation_data_cached(tmp_path):
+    gold_path, save_path = tmp_path / 'gold.json', tmp_path / 'eval.json'
+    records = [{'query': 'q{}'.format(i), 'gold': []} for i in range(30)]
+    gold_path.write_text(json.dumps(records))
+
+    with SegmenterCache(tmp_path / 'cache.sqlite') as cache:
+        compose_evaluation_data(FakeSegmenter(), gold_path, save_path, cache=cache, segmenter_id='v1')
+        assert len(cache) == 30
+    expected = save_path.read_text()
+
+    records += [{'query': 'q{}'.format(i), 'gold': []} for i in range(30, 35)]
+    gold_path.write_text(json.dumps(records))
+    with SegmenterCache(tmp_path / 'cache.sqlite') as cache:
+        segmenter = FakeSegmenter()
+        compose_evaluation_data(segmenter, gold_path, save_path, workers=2, cache=cache, segmenter_id='v1')
+        assert sorted(segmenter.queries) == ['q30', 'q31', 'q32', 'q33', 'q34']
+        assert json.loads(save_path.read_text())[:30] == json.loads(expected)
+
+        segmenter = FakeSegmenter()
+        compose_evaluation_data(segmenter, gold_path, save_path, cache=cache, segmenter_id='v2')
+        assert len(segmenter.queries) == 35
+
+    with pytest.raises(ValueError):
+        compose_evaluation_data(FakeSegmenter(), gold_path, save_path, cache=cache)
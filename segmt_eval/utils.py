@@ -1,59 +1,68 @@
 import itertools
 import json
-from typing import List, Tuple, TypeVar
+import os
+import re
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple, TypeVar
 import unicodedata
 
 from tqdm import tqdm
 import numpy as np
 
-from segmt_eval.item import Item
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from segmt_eval.cache import SegmenterCache
+from segmt_eval.item import Item, ItemBatch, StringTable
 
 T = TypeVar('T')
 
 
-def edit_ops(A: List[T], B: List[T]) -> List[Tuple[T, T]]:
+# rows of the cost matrix up to this width are filled with plain python integers;
+# below it, the per-row overhead of the numpy calls outweighs their speed
+_SMALL_SPAN = 96
+
+# in linear memory mode, spans with at most this many cells are aligned with a full
+# backpointer matrix instead of being split further
+_LINEAR_BLOCK_CELLS = 1 << 16
+
+
+def edit_ops(A: List[T], B: List[T], linear_memory: bool = False) -> List[Tuple[T, T]]:
     """Collect the edits needed to transform A into B
 
     Parameters
     ----------
     A, B: lists of same type
+    linear_memory: use Hirschberg's divide and conquer to align A and B in memory linear
+        in their length, rather than allocating a len(A) x len(B) backpointer matrix.
+        The edits are optimal, but when several alignments have the same cost, this
+        mode can return a different one.
 
     Returns
     -------
     edits: aligned pairs of values from A and B.
     """
-    mA, mB = len(A), len(B)
-    M = np.zeros((mA + 1, mB + 1), np.uint8)
-    M[:, 0] = np.arange(0, mA + 1)
-    M[0, :] = np.arange(0, mB + 1)
-    BP = np.zeros_like(M)
-    BP[:, 0] = 3
-    BP[0, :] = 4
+    if linear_memory and len(A) * len(B) > _LINEAR_BLOCK_CELLS:
+        codes = {}
+        a_ids = np.array([codes.setdefault(x, len(codes)) for x in A], dtype=np.int64)
+        b_ids = np.array([codes.setdefault(x, len(codes)) for x in B], dtype=np.int64)
+        return _edit_ops_linear(A, B, a_ids, b_ids)
+    if len(B) <= _SMALL_SPAN:
+        BP = _edit_backpointers_small(A, B)
+    else:
+        BP = _edit_backpointers(A, B)
     # backpointers:
     # 1 = diagonal - equal
     # 2 = diagonal - substitution
     # 3 = vertical - insertion
     # 4 = horizontal - deletion
-
-    for i in range(1, mA + 1):
-        for j in range(1, mB + 1):
-            if A[i - 1] == B[j - 1]:
-                M[i, j] = M[i - 1, j - 1]
-                BP[i, j] = 1
-            else:
-                costs = [M[i - 1, j], M[i, j - 1], M[i - 1, j - 1]]
-                argmin: int = np.argmin(costs)
-                if argmin == 0:
-                    BP[i, j] = 3
-                elif argmin == 1:
-                    BP[i, j] = 4
-                else:
-                    BP[i, j] = 2
-                M[i, j] = costs[argmin] + 1
     edits = []
-    i, j = mA, mB
+    i, j = len(A), len(B)
     while i > 0 or j > 0:
-        move = BP[i, j]
+        move = BP[i][j]
         if move == 0:
             break
         elif move in [1, 2]:
@@ -69,6 +78,113 @@ def edit_ops(A: List[T], B: List[T]) -> List[Tuple[T, T]]:
     return edits[::-1]
 
 
+def _edit_ops_linear(A: List[T], B: List[T], a_ids: np.ndarray, b_ids: np.ndarray) -> List[Tuple[T, T]]:
+    """Hirschberg's algorithm: split A in half, find where an optimal alignment crosses
+    the middle from the last cost rows of both halves and recurse on the two parts.
+    """
+    if len(A) <= 1 or len(A) * len(B) <= _LINEAR_BLOCK_CELLS:
+        return edit_ops(A, B)
+    mid = len(A) // 2
+    upper = _last_cost_row(a_ids[:mid], b_ids).astype(np.int64)
+    lower = _last_cost_row(a_ids[mid:][::-1], b_ids[::-1])[::-1]
+    split = int(np.argmin(upper + lower))
+    return _edit_ops_linear(A[:mid], B[:split], a_ids[:mid], b_ids[:split]) + \
+        _edit_ops_linear(A[mid:], B[split:], a_ids[mid:], b_ids[split:])
+
+
+def _cost_dtype(n: int) -> np.dtype:
+    """Smallest signed integer type that holds edit costs and column offsets up to n
+    """
+    return np.min_scalar_type(-n - 1)
+
+
+def _cost_rows(a_ids: np.ndarray, b_ids: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Compute the cost matrix of aligning a_ids and b_ids one row at a time
+
+    Only the previous row of costs is kept. Within a row, the dependency on the left
+    neighbour is resolved with a running minimum: M[i, j] = min_k (C[k] + j - k), where
+    C holds the costs reachable from the previous row.
+
+    Yields
+    ------
+    for every row i > 0: the previous row, the row itself, and the mask of columns
+    where the values of row and column are equal
+    """
+    mA, mB = len(a_ids), len(b_ids)
+    cols = np.arange(0, mB + 1, dtype=_cost_dtype(mA + mB + 1))
+    prev = cols
+    for i in range(1, mA + 1):
+        equal = b_ids == a_ids[i - 1]
+        reach = np.empty_like(prev)
+        reach[0] = i
+        np.minimum(prev[1:] + 1, prev[:-1] + ~equal, out=reach[1:])
+        curr = np.minimum.accumulate(reach - cols) + cols
+        yield prev, curr, equal
+        prev = curr
+
+
+def _last_cost_row(a_ids: np.ndarray, b_ids: np.ndarray) -> np.ndarray:
+    """Costs of aligning all of a_ids with every prefix of b_ids
+    """
+    last = np.arange(0, len(b_ids) + 1, dtype=_cost_dtype(len(a_ids) + len(b_ids) + 1))
+    for _, last, _ in _cost_rows(a_ids, b_ids):
+        pass
+    return last
+
+
+def _edit_backpointers_small(A: List[T], B: List[T]) -> List[List[int]]:
+    """Fill the backpointer matrix of `edit_ops` with plain python integers
+    """
+    mA, mB = len(A), len(B)
+    prev = list(range(mB + 1))
+    BP = [[4] * (mB + 1)]
+    for i in range(1, mA + 1):
+        a = A[i - 1]
+        curr = [i] * (mB + 1)
+        bp = [3] * (mB + 1)
+        for j in range(1, mB + 1):
+            if a == B[j - 1]:
+                curr[j] = prev[j - 1]
+                bp[j] = 1
+            else:
+                # ties are broken in the order insertion, deletion, substitution
+                up, left, diag = prev[j], curr[j - 1], prev[j - 1]
+                if up <= left and up <= diag:
+                    curr[j] = up + 1
+                    bp[j] = 3
+                elif left <= diag:
+                    curr[j] = left + 1
+                    bp[j] = 4
+                else:
+                    curr[j] = diag + 1
+                    bp[j] = 2
+        BP.append(bp)
+        prev = curr
+    return BP
+
+
+def _edit_backpointers(A: List[T], B: List[T]) -> np.ndarray:
+    """Fill the backpointer matrix of `edit_ops` one row at a time with numpy
+
+    The backpointers of a row follow from comparing each cell with its three
+    predecessors once the row is known.
+    """
+    mA, mB = len(A), len(B)
+    codes = {}
+    a_ids = np.array([codes.setdefault(x, len(codes)) for x in A], dtype=np.int64)
+    b_ids = np.array([codes.setdefault(x, len(codes)) for x in B], dtype=np.int64)
+
+    BP = np.zeros((mA + 1, mB + 1), np.uint8)
+    BP[:, 0] = 3
+    BP[0, :] = 4
+    for i, (prev, curr, equal) in enumerate(_cost_rows(a_ids, b_ids), 1):
+        up, left, diag = prev[1:], curr[:-1], prev[:-1]
+        bp = np.where(up <= np.minimum(left, diag), 3, np.where(left <= diag, 4, 2))
+        bp[equal] = 1
+        BP[i, 1:] = bp
+    return BP
+
+
 def is_contiguous(items: List[Item]) -> bool:
     """Checks whether all items in a sorted list of items are adjacent to each other
     """
@@ -77,13 +193,14 @@ def is_contiguous(items: List[Item]) -> bool:
     return all(o.endOffSet == s.startOffSet for o, s in zip(orig, shift))
 
 
-def align_items(a: List[Item], b: List[Item]) -> List[Tuple[List[Item], List[Item]]]:
+def align_items(a: List[Item], b: List[Item], tolerant: bool = False) -> List[Tuple[List[Item], List[Item]]]:
     """Align items between a and b.
 
     Parameters
     ----------
     a, b: Lists of items to align. Both lists are assumed to be composed of contiguous non-overlapping items
     and span the same total length
+    tolerant: align items that break these assumptions instead of raising, see `align_items_tolerant`
 
     Returns
     -------
@@ -91,11 +208,16 @@ def align_items(a: List[Item], b: List[Item]) -> List[Tuple[List[Item], List[Ite
     they cover the same span. In the ideal case, i.e. every item is aligned to a single item,
     each list in the pair is a singleton.
     """
-    a = sorted(a, key=lambda it: (it.startOffSet, -it.endOffSet))
-    b = sorted(b, key=lambda it: (it.startOffSet, -it.endOffSet))
+    if tolerant:
+        return align_items_tolerant(a, b)[0]
 
-    min_a, max_a = min(item.startOffSet for item in a), max(item.endOffSet for item in a)
-    min_b, max_b = min(item.startOffSet for item in b), max(item.endOffSet for item in b)
+    a, max_a = _ordered_items(a)
+    b, max_b = _ordered_items(b)
+
+    if not a or not b:
+        raise ValueError('a and b need to cover the same total span')
+
+    min_a, min_b = a[0].startOffSet, b[0].startOffSet
 
     if min_a != min_b or max_a != max_b:
         raise ValueError('a and b need to cover the same total span')
@@ -109,34 +231,266 @@ def align_items(a: List[Item], b: List[Item]) -> List[Tuple[List[Item], List[Ite
     while char_ix < end_ix:
         curr_a = a[a_ix]
         curr_b = b[b_ix]
-        if char_ix < min(curr_a.startOffSet, curr_b.startOffSet):
-            char_ix += 1
+        end_a, end_b = curr_a.endOffSet, curr_b.endOffSet
+        next_start = min(curr_a.startOffSet, curr_b.startOffSet)
+        if char_ix < next_start:
+            # skip the gap before the next item
+            char_ix = next_start
             continue
-        if curr_a.endOffSet == curr_b.endOffSet:
+        if end_a == end_b:
             # wrap up the alignment
             curr_pair[0].append(curr_a)
             curr_pair[1].append(curr_b)
             result.append(curr_pair)
             curr_pair = ([], [])
-            char_ix = curr_a.endOffSet
+            char_ix = end_a
             a_ix += 1
             b_ix += 1
-        elif curr_a.endOffSet < curr_b.endOffSet:
+        elif end_a < end_b:
             curr_pair[0].append(curr_a)
-            char_ix = curr_a.endOffSet
+            char_ix = end_a
             a_ix += 1
-        else:  # curr_a.endOffSet > curr_b.endOffSet
+        else:  # end_a > end_b
             curr_pair[1].append(curr_b)
-            char_ix = curr_b.endOffSet
+            char_ix = end_b
             b_ix += 1
     return result
 
 
+def align_items_tolerant(a: List[Item], b: List[Item]) -> Tuple[List[Tuple[List[Item], List[Item]]], Counter]:
+    """Align items between a and b, whatever span they cover.
+
+    Items are taken in order of their start from both lists, and an alignment is closed once the next item
+    starts after the items of both sides, provided these end at the same offset or one side has none. This is
+    the same alignment as `align_items` for items that meet its assumptions. Beyond them, text covered by a
+    single side is aligned to an empty list, and items overlapping the previous items of their side are aligned
+    together with them.
+
+    Parameters
+    ----------
+    a, b: Lists of items to align
+
+    Returns
+    -------
+    List of pairs as in `align_items`, and counts of the irregularities met:
+    `span_mismatch` (a and b do not cover the same total span), `uncovered` (alignments with items of a single
+    side) and `overlapping` (items overlapping a previous item of their side).
+    """
+    a, max_a = _ordered_items(a)
+    b, max_b = _ordered_items(b)
+
+    issues = Counter()
+    if not a or not b or a[0].startOffSet != b[0].startOffSet or max_a != max_b:
+        issues['span_mismatch'] += 1
+
+    result = []
+    a_ix = b_ix = 0
+    curr_pair = ([], [])
+    # largest end offset of the items of each side in the current alignment
+    ends = [None, None]
+    group_start = None
+    while a_ix < len(a) or b_ix < len(b):
+        if b_ix == len(b) or (a_ix < len(a) and a[a_ix].startOffSet <= b[b_ix].startOffSet):
+            side, item = 0, a[a_ix]
+            a_ix += 1
+        else:
+            side, item = 1, b[b_ix]
+            b_ix += 1
+        start = item.startOffSet
+        if curr_pair[0] or curr_pair[1]:
+            extent = max(end for end in ends if end is not None)
+            if start >= extent and (ends[0] == ends[1] or
+                                    (None in ends and (start > extent or start > group_start))):
+                # wrap up the alignment
+                if ends[0] is None or ends[1] is None:
+                    issues['uncovered'] += 1
+                result.append(curr_pair)
+                curr_pair = ([], [])
+                ends = [None, None]
+                group_start = start
+            elif ends[side] is not None and start < ends[side]:
+                issues['overlapping'] += 1
+        else:
+            group_start = start
+        curr_pair[side].append(item)
+        ends[side] = item.endOffSet if ends[side] is None else max(ends[side], item.endOffSet)
+    if curr_pair[0] or curr_pair[1]:
+        if ends[0] is None or ends[1] is None:
+            issues['uncovered'] += 1
+        result.append(curr_pair)
+    return result, issues
+
+
+def _ordered_items(items: List[Item]) -> Tuple[List[Item], int]:
+    """Sort items by start offset and decreasing end offset, unless they already are
+
+    Returns
+    -------
+    the sorted items and their largest end offset, or None if there are no items
+    """
+    if isinstance(items, ItemBatch):
+        starts, ends = items.startOffSet.tolist(), items.endOffSet.tolist()
+        items = items.to_items()
+    else:
+        starts = [it.startOffSet for it in items]
+        ends = [it.endOffSet for it in items]
+    if not all(s1 < s2 or (s1 == s2 and e1 >= e2)
+               for s1, s2, e1, e2 in zip(starts, starts[1:], ends, ends[1:])):
+        items = sorted(items, key=lambda it: (it.startOffSet, -it.endOffSet))
+    return items, max(ends, default=None)
+
+
+def align_offsets(sent_a: np.ndarray, starts_a: np.ndarray, ends_a: np.ndarray,
+                  sent_b: np.ndarray, starts_b: np.ndarray, ends_b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Align the items of many sentences at once, given as offset arrays.
+
+    Counterpart of `align_items` for sentences whose items are ordered, contiguous and non-overlapping: an
+    alignment is closed at every end offset that a and b share within a sentence.
+
+    Parameters
+    ----------
+    sent_a, sent_b: sentence id of every item, non-decreasing
+    starts_a, ends_a, starts_b, ends_b: offsets of every item. a and b need to cover the same total span in every
+        sentence.
+
+    Returns
+    -------
+    alignment of every item of a and of b. Alignments are numbered in order over all sentences, so that the items
+    of a and of b with the same number form one pair of `align_items`.
+    """
+    radix = int(max(ends_a.max(initial=0), ends_b.max(initial=0))) + 1
+    keys_a = sent_a.astype(np.int64) * radix + ends_a
+    keys_b = sent_b.astype(np.int64) * radix + ends_b
+    # keys are sorted, as the items are ordered
+    shared = np.zeros(len(keys_a), dtype=bool)
+    if len(keys_b):
+        shared = keys_b[np.minimum(np.searchsorted(keys_b, keys_a), len(keys_b) - 1)] == keys_a
+    closing = keys_a[shared]
+    alignment_a = np.searchsorted(closing, keys_a)
+    alignment_b = np.searchsorted(closing, keys_b)
+    # every item needs to be followed by a shared end in its own sentence
+    closing_sent = np.append(closing // radix, -1)
+    if np.any(closing_sent[alignment_a] != sent_a) or np.any(closing_sent[alignment_b] != sent_b):
+        raise ValueError('a and b need to cover the same total span')
+    return alignment_a, alignment_b
+
+
 def load_json(data_path):
-    data_file = open(data_path, 'r', encoding='utf8')
-    data_str = data_file.read()
-    data_file.close()
-    return json.loads(data_str)
+    with open(data_path, 'rb') as data_file:
+        return _json_loads(data_file.read())
+
+
+def _json_loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf8'))
+
+
+def _load_records(data_path) -> List[Dict]:
+    # records of a JSON array or JSON Lines file, read at once
+    with open(data_path, 'rb') as data_file:
+        data = data_file.read()
+    start = re.match(rb'\s*', data).end()
+    if data[start:start + 1] == b'[':
+        return _json_loads(data)
+    return [_json_loads(line) for line in data.splitlines() if line.strip()]
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+# longest partial token a cut off record can end with, e.g. `\u12` or `fals`
+_JSON_CUT_OFF_MARGIN = 6
+
+
+def iter_json(data_path, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Iterate over the records of a JSON array or JSON Lines file without reading it whole
+
+    Parameters
+    ----------
+    data_path: path to a file holding either a JSON array of objects or one JSON object per line
+    chunk_size: number of characters read at a time
+
+    Returns
+    -------
+    iterator over the decoded records. Only the record being decoded is held in memory.
+    """
+    with open(data_path, 'r', encoding='utf8') as data_file:
+        buf, pos, eof = '', 0, False
+        is_array = None
+        while True:
+            # skip whitespace and commas between records, reading on until the next record starts
+            pos = _JSON_SEPARATORS.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    break
+                chunk = data_file.read(chunk_size)
+                buf, pos, eof = chunk, 0, not chunk
+                continue
+            if is_array is None:
+                is_array = buf[pos] == '['
+                if is_array:
+                    pos += 1
+                    continue
+            if is_array and buf[pos] == ']':
+                break
+            try:
+                record, pos = _JSON_DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError as err:
+                if eof or not _is_cut_off(err, buf):
+                    raise
+                # the record is cut off: read at least as much again as is buffered, and retry
+                chunk = data_file.read(max(chunk_size, len(buf) - pos))
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                continue
+            yield record
+
+
+def _is_cut_off(err: json.JSONDecodeError, buf: str) -> bool:
+    # a record cut off at the end of the buffer fails at its end, up to a partial literal or escape sequence,
+    # or in a string that runs to the end. Errors elsewhere are malformed records.
+    return err.pos >= len(buf) - _JSON_CUT_OFF_MARGIN or err.msg.startswith('Unterminated string')
+
+
+def iter_sentence_pairs(data_path, columnar: bool = False) -> Iterator[Tuple[List[Item], List[Item]]]:
+    """Iterate over the gold and predicted items of each sentence in an evaluation file
+
+    Parameters
+    ----------
+    data_path: JSON array or JSON Lines file of records with "gold" and "pred" item lists
+    columnar: yield ItemBatches sharing a single StringTable instead of lists of Items
+
+    Returns
+    -------
+    iterator over pairs of gold and predicted items, one sentence at a time
+    """
+    table = StringTable()
+    for sent in iter_json(data_path):
+        if columnar:
+            yield ItemBatch.from_dicts(sent['gold'], table), ItemBatch.from_dicts(sent['pred'], table)
+        else:
+            yield Item.from_dicts(sent['gold']), Item.from_dicts(sent['pred'])
+
+
+def itemize_corpus(data_path, columnar: bool = False) -> Tuple[List[List[Item]], List[List[Item]]]:
+    """Read the gold and predicted items of all sentences of an evaluation file
+
+    Unlike `iter_sentence_pairs`, the file is read at once, and decoded with orjson when it is installed.
+
+    Parameters
+    ----------
+    data_path: JSON array or JSON Lines file of records with "gold" and "pred" item lists
+    columnar: return ItemBatches sharing a single StringTable instead of lists of Items
+
+    Returns
+    -------
+    gold and predicted items of every sentence
+    """
+    data = _load_records(data_path)
+    if columnar:
+        table = StringTable()
+        return [ItemBatch.from_dicts(sent['gold'], table) for sent in data], \
+            [ItemBatch.from_dicts(sent['pred'], table) for sent in data]
+    return [Item.from_dicts(sent['gold']) for sent in data], [Item.from_dicts(sent['pred']) for sent in data]
 
 
 def save_json(data_path, data):
@@ -168,16 +522,137 @@ def find_gold_term(query_gold: list, item_text: str, item_start_char_index: int)
     return match
 
 
-def compose_evaluation_data(segmenter, gold_path, save_path):
+def compose_evaluation_data(segmenter, gold_path, save_path, workers: int = 1, batch_size: int = 1,
+                            max_in_flight: int = None, checkpoint_path=None, cache: SegmenterCache = None,
+                            segmenter_id: str = None):
+    """Segment the queries of a gold set and save them along with their predicted items
+
+    Parameters
+    ----------
+    segmenter: object whose `segment(query)` returns the JSON encoded items of a query. When it also has
+        `segment_batch(queries)`, returning the outputs of a list of queries, that is called instead with up to
+        `batch_size` queries at a time.
+    gold_path: JSON file of records with a "query" or "expanded_query"
+    save_path: JSON file to write the records to, with the decoded items in "pred"
+    workers: number of threads calling the segmenter
+    batch_size: number of queries per call of `segment_batch`
+    max_in_flight: largest number of batches submitted to the threads and not yet done, `2 * workers` by default
+    checkpoint_path: JSON Lines file to which the predictions are appended as they are done. When it exists, the
+        queries it holds are not segmented again, so an interrupted run resumes where it stopped. Records are
+        only reused for the same query at the same index, so the gold set may change between runs.
+    cache: cache of segmenter outputs. Queries with a cached output for `segmenter_id` are not segmented, and
+        the outputs of the others are added to the cache.
+    segmenter_id: id of the segmenter and its version in the cache, required with `cache`
+    """
+    if cache is not None and segmenter_id is None:
+        raise ValueError('caching segmenter outputs needs a segmenter_id')
     if segmenter is not None:
         eval_data = load_json(gold_path)
-        for q in tqdm(eval_data):
-            target_query = q['expanded_query'] if 'expanded_query' in q else q['query']
-            output = segmenter.segment(target_query)
-            q['pred'] = json.loads(output)
+        queries = [q['expanded_query'] if 'expanded_query' in q else q['query'] for q in eval_data]
+        done = _load_checkpoint(checkpoint_path, queries) if checkpoint_path is not None else {}
+        for ix, pred in done.items():
+            eval_data[ix]['pred'] = pred
+        todo = [ix for ix in range(len(eval_data)) if ix not in done]
+        hits = {}
+        if cache is not None:
+            for ix in todo:
+                output = cache.get(segmenter_id, queries[ix])
+                if output is not None:
+                    hits[ix] = output
+            cache.commit()
+
+        checkpoint = None
+        if checkpoint_path is not None:
+            checkpoint = open(checkpoint_path, 'a', encoding='utf8')
+            if not _ends_line(checkpoint_path):
+                # end a line cut off by an interrupted run
+                checkpoint.write('\n')
+        try:
+            with tqdm(total=len(todo)) as progress:
+                results = _segment_queries(segmenter, queries, [ix for ix in todo if ix not in hits], workers,
+                                           batch_size, max_in_flight or 2 * workers)
+                if cache is not None:
+                    results = _cache_outputs(results, cache, segmenter_id, queries)
+                if hits:
+                    results = itertools.chain([(list(hits), list(hits.values()))], results)
+                for indices, outputs in results:
+                    for ix, output in zip(indices, outputs):
+                        eval_data[ix]['pred'] = json.loads(output)
+                        if checkpoint is not None:
+                            checkpoint.write(json.dumps({'index': ix, 'query': queries[ix],
+                                                         'pred': eval_data[ix]['pred']}, ensure_ascii=False) + '\n')
+                    if checkpoint is not None:
+                        checkpoint.flush()
+                    progress.update(len(indices))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
         save_json(save_path, eval_data)
 
 
+def _segment_queries(segmenter, queries: List[str], indices: List[int], workers: int, batch_size: int,
+                     max_in_flight: int) -> Iterator[Tuple[List[int], List[str]]]:
+    # yields the indices of each batch of queries with the segmenter outputs, in the order the batches are done
+    if batch_size > 1 and hasattr(segmenter, 'segment_batch'):
+        def segment_batch(batch):
+            return segmenter.segment_batch([queries[ix] for ix in batch])
+    else:
+        def segment_batch(batch):
+            return [segmenter.segment(queries[ix]) for ix in batch]
+
+    batches = (indices[i:i + batch_size] for i in range(0, len(indices), batch_size))
+    if workers <= 1:
+        for batch in batches:
+            yield batch, segment_batch(batch)
+        return
+
+    with ThreadPoolExecutor(workers) as executor:
+        # bound the number of batches in flight, so a large gold set is not submitted at once
+        pending = {}
+        for batch in itertools.chain(batches, [None]):
+            if batch is not None:
+                pending[executor.submit(segment_batch, batch)] = batch
+            while pending and (batch is None or len(pending) >= max_in_flight):
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield pending.pop(future), future.result()
+
+
+def _cache_outputs(results: Iterator[Tuple[List[int], List[str]]], cache: SegmenterCache, segmenter_id: str,
+                   queries: List[str]) -> Iterator[Tuple[List[int], List[str]]]:
+    for indices, outputs in results:
+        for ix, output in zip(indices, outputs):
+            cache.put(segmenter_id, queries[ix], output)
+        cache.commit()
+        yield indices, outputs
+
+
+def _ends_line(path) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _load_checkpoint(checkpoint_path, queries: List[str]) -> Dict[int, List[Dict]]:
+    # predictions by query index of a checkpoint file, skipping a line cut off by an interrupted run and the
+    # records of queries that are no longer at their index
+    done = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf8') as checkpoint:
+            for line in checkpoint:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                ix = record['index']
+                if ix < len(queries) and record.get('query') == queries[ix]:
+                    done[ix] = record['pred']
+    return done
+
+
 def convert_items_to_bio(items: List[Item]):
     if not items:
         return []
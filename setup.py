@@ -11,10 +11,13 @@ setuptools.setup(
     long_description=description,
     long_description_content_type='text/markdown',
     url='https://git.huawei.com/BigData_Platform/BD_netherlands',
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks']),
     install_requires=[
         'tqdm'
     ],
+    extras_require={
+        'fast': ['orjson']
+    },
     include_package_data=True,
     classifiers=[
         'Programming Language :: Python :: 3',